@@ -13,7 +13,10 @@ TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': 'default.db'
+        'NAME': 'default.db',
+        # a file, rather than an in-memory database, is shared with
+        # the threads of transports under test
+        'TEST_NAME': 'test.db',
     }
 }
 
@@ -32,6 +35,9 @@ ROUTES = (
     (r'^(?P<text>.*)$', 'djangosms.apps.common.forms.Input'),
     )
 
+# create missing route records for the routing table on startup
+CREATE_ROUTES = True
+
 INSTALLED_APPS = (
     'django.contrib.auth',
     'django.contrib.contenttypes',
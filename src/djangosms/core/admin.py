@@ -8,4 +8,5 @@ admin.site.register(models.Route)
 admin.site.register(models.Request)
 admin.site.register(models.Incoming)
 admin.site.register(models.Outgoing)
+admin.site.register(models.Outbox)
 
@@ -0,0 +1,141 @@
+import sys
+
+from datetime import datetime
+from threading import Lock
+from threading import Thread
+from time import mktime
+from time import sleep
+from traceback import format_exc
+from warnings import warn
+from weakref import ref as weakref
+
+from django.db import close_connection
+
+from .models import Outgoing
+
+class DeliveryBuffer(object):
+    """Buffer for delivery confirmations.
+
+    :param size: The buffer is applied when this number of confirmations is reached (if ``0``, each confirmation is applied immediately).
+
+    :param interval: The buffer is applied at this interval (in seconds).
+
+    :param spool: Optional :class:`Spool <djangosms.core.spool.Spool>` object; confirmations are journaled here until applied so they survive a crash.
+
+    Confirmations are applied in bulk, using a single ``UPDATE``
+    statement for each distinct delivery time.
+    """
+
+    def __init__(self, size=0, interval=5.0, spool=None):
+        self.size = size
+        self.spool = spool
+        self._lock = Lock()
+        self._entries = []
+        self._stopped = False
+
+        # replay confirmations left over from a previous run
+        if spool is not None:
+            while True:
+                entry = spool.claim()
+                if entry is None:
+                    break
+                key, record = entry
+                self._entries.append((key, record))
+
+            self.flush()
+
+        if size:
+            reference = weakref(self)
+
+            def flusher():
+                try:
+                    while True:
+                        sleep(interval)
+                        buffer = reference()
+                        if buffer is None or buffer._stopped:
+                            break
+                        try:
+                            buffer.flush()
+                        except:
+                            cls, exc, tb = sys.exc_info()
+                            warn("%s ERROR [%s] - Unable to apply delivery "
+                                 "confirmations.\n\n%s" % (
+                                     datetime.now().isoformat(),
+                                     type(exc).__name__, format_exc(exc)))
+                        del buffer
+                finally:
+                    close_connection()
+
+            thread = Thread(target=flusher)
+            thread.setDaemon(True)
+            thread.start()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, time, message_id=None, batch=None, uri=None):
+        """Add delivery confirmation for the message ``message_id``,
+        or for the recipient ``uri`` of the batch ``batch``."""
+
+        record = {
+            'timestamp': _timestamp(time),
+            'id': message_id,
+            'batch': batch,
+            'uri': uri,
+            }
+
+        key = None
+        if self.spool is not None:
+            key = self.spool.put(record, claimed=True)
+
+        with self._lock:
+            self._entries.append((key, record))
+            full = len(self._entries) >= self.size
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Apply buffered delivery confirmations."""
+
+        with self._lock:
+            entries, self._entries = self._entries, []
+
+        if not entries:
+            return
+
+        by_time = {}
+        for key, record in entries:
+            ids, batches = by_time.setdefault(record['timestamp'], ([], {}))
+            if record.get('batch') is not None:
+                batches.setdefault(record['batch'], []).append(record['uri'])
+            else:
+                ids.append(record['id'])
+
+        try:
+            for timestamp, (ids, batches) in by_time.items():
+                time = datetime.fromtimestamp(timestamp)
+                if ids:
+                    Outgoing.objects.filter(pk__in=ids).update(delivery=time)
+                for batch, uris in batches.items():
+                    Outgoing.objects.filter(
+                        delivery_id=batch, connection__in=uris).update(
+                        delivery=time)
+        except:
+            # keep the confirmations for the next attempt
+            with self._lock:
+                self._entries[:0] = entries
+            raise
+
+        if self.spool is not None:
+            for key, record in entries:
+                self.spool.done(key)
+
+    def stop(self):
+        """Apply buffered confirmations and stop the flush thread."""
+
+        self._stopped = True
+        self.flush()
+
+def _timestamp(time):
+    return mktime(time.timetuple()) + time.microsecond / 1e6
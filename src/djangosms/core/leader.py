@@ -0,0 +1,80 @@
+import os
+import errno
+
+try:
+    import fcntl
+except ImportError: # pragma: NOCOVER
+    fcntl = None
+
+# lock held (or awaited) by this process; see :func:`elect`
+_lock = None
+
+class LeaderLock(object):
+    """Exclusive lock on a local file.
+
+    The lock elects a single leader among the processes which run the
+    application (e.g. the workers of a preforking server). It's held
+    until the process exits.
+
+    :param path: Lock file path (created if required).
+    """
+
+    held = False
+
+    def __init__(self, path):
+        if fcntl is None: # pragma: NOCOVER
+            raise ImportError('fcntl')
+
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0644)
+
+    def acquire(self, blocking=False):
+        """Acquire the lock; returns ``True`` if successful.
+
+        If ``blocking`` is set, wait until the lock is released by the
+        current holder.
+        """
+
+        if self.held:
+            return True
+
+        flags = fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+
+        try:
+            fcntl.flock(self._fd, flags)
+        except IOError, error:
+            if error.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+
+        # record process id for the benefit of the operator
+        os.ftruncate(self._fd, 0)
+        os.write(self._fd, "%d\n" % os.getpid())
+        self.held = True
+        return True
+
+    def release(self):
+        """Release the lock."""
+
+        if self.held:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self.held = False
+
+def elect(path):
+    """Try to become the leader process using a lock file at
+    ``path``; returns the lock object.
+    """
+
+    global _lock
+    _lock = LeaderLock(path)
+    _lock.acquire()
+    return _lock
+
+def is_leader():
+    """Return ``True`` if this process is responsible for exclusive
+    work; this is always the case if no election has taken place.
+    """
+
+    return _lock is None or _lock.held
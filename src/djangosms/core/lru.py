@@ -0,0 +1,82 @@
+from threading import Lock
+
+class LRUCache(object):
+    """Bounded mapping which discards the least recently used items.
+
+    :param size: Maximum number of items (if ``0``, nothing is cached).
+
+    This implementation is thread-safe.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._map = {}
+        self._lock = Lock()
+
+        # circular doubly linked list of [prev, next, key, value]
+        # links; the root link's next item is the least recently used
+        root = self._root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def get(self, key, default=None):
+        """Return the value for ``key`` (or ``default``)."""
+
+        with self._lock:
+            link = self._map.get(key)
+            if link is None:
+                return default
+            self._unlink(link)
+            self._append(link)
+            return link[3]
+
+    def set(self, key, value):
+        """Set the value for ``key``."""
+
+        if not self.size:
+            return
+
+        with self._lock:
+            link = self._map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+            elif len(self._map) >= self.size:
+                oldest = self._root[1]
+                self._unlink(oldest)
+                del self._map[oldest[2]]
+
+            link = [None, None, key, value]
+            self._append(link)
+            self._map[key] = link
+
+    def discard(self, key):
+        """Remove ``key`` if it's in the cache."""
+
+        with self._lock:
+            link = self._map.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+
+    def clear(self):
+        """Remove all items."""
+
+        with self._lock:
+            self._map.clear()
+            root = self._root
+            root[:] = [root, root, None, None]
+
+    def _append(self, link):
+        root = self._root
+        last = root[0]
+        link[0], link[1] = last, root
+        last[1] = root[0] = link
+
+    def _unlink(self, link):
+        prev, next = link[0], link[1]
+        prev[1] = next
+        next[0] = prev
@@ -0,0 +1,40 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from djangosms.core.models import Outbox
+from djangosms.core.models import Outgoing
+
+class Command(BaseCommand):
+    help = 'Queues outgoing messages which were pending before the ' \
+           'outbox was introduced (run after upgrading)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500,
+                    help='Number of messages to queue in a single '
+                    'transaction'),
+        )
+
+    def handle(self, **options):
+        batch_size = options.get('batch_size', 500)
+        query = Outgoing.objects.filter(time=None, failed=False).exclude(
+            connection=None).exclude(
+            in_response_to__message__suppress_responses=True).exclude(
+            pk__in=Outbox.objects.values('message'))
+        pending = list(query.order_by('pk').values_list(
+            'pk', 'connection', 'priority'))
+
+        for i in range(0, len(pending), batch_size):
+            self._queue(pending[i:i + batch_size])
+
+        print "Queued %d message(s)." % len(pending)
+
+    @staticmethod
+    @transaction.commit_on_success
+    def _queue(batch):
+        for pk, uri, priority in batch:
+            transport = uri.split('://', 1)[0]
+            Outbox(message_id=pk, transport=transport,
+                   priority=priority).save()
@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from djangosms.core.models import User
+from djangosms.core.models import latest_connections
+
+class Command(BaseCommand):
+    help = 'Records the latest activity and the most recently used ' \
+           'connection of each user (run after upgrading)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500,
+                    help='Number of users to update in a single '
+                    'transaction'),
+        )
+
+    def handle(self, **options):
+        batch_size = options.get('batch_size', 500)
+        recent = sorted(latest_connections(User.objects.all()).items())
+
+        for i in range(0, len(recent), batch_size):
+            self._update(recent[i:i + batch_size])
+
+        print "Updated %d user(s)." % len(recent)
+
+    @staticmethod
+    @transaction.commit_on_success
+    def _update(batch):
+        for user, (uri, latest) in batch:
+            User.objects.filter(pk=user).update(last_seen=latest, last_uri=uri)
@@ -0,0 +1,113 @@
+from optparse import make_option
+from time import sleep
+from time import time as get_time
+
+from django.core.management.base import BaseCommand
+
+from djangosms.core.models import Outgoing
+from djangosms.core.testing import Modem
+from djangosms.core.transports import GSM
+
+class Command(BaseCommand):
+    args = '[text]'
+    help = 'Measures send latency, polling overhead and throughput ' \
+           'of the GSM transport using a simulated modem (use with a ' \
+           'scratch database)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', dest='count', type='int', default=100,
+                    help='Number of messages to send'),
+        make_option('--mode', dest='mode', default='text',
+                    help='Message mode ("text" or "pdu")'),
+        make_option('--latency', dest='latency', type='float',
+                    default=0.01,
+                    help='Time in seconds for the modem to process '
+                    'a command'),
+        make_option('--error-rate', dest='error_rate', type='float',
+                    default=0.0,
+                    help='Probability that a submission fails'),
+        make_option('--arrival-rate', dest='arrival_rate', type='float',
+                    default=0.0,
+                    help='Incoming messages per second'),
+        make_option('--rate', dest='rate', type='float', default=0.0,
+                    help='Messages created per second (by default, '
+                    'all messages are created at once)'),
+        make_option('--idle', dest='idle', type='float', default=5.0,
+                    help='Time in seconds to measure polling while idle'),
+        make_option('--timeout', dest='timeout', type='float',
+                    default=600.0,
+                    help='Give up after this number of seconds'),
+        )
+
+    def handle(self, text="benchmark", **options):
+        count = options.get('count', 100)
+        modem = Modem(
+            latency=options.get('latency', 0.01),
+            error_rate=options.get('error_rate', 0.0),
+            arrival_rate=options.get('arrival_rate', 0.0),
+            seed=0)
+
+        class Transport(GSM):
+            def connect(self):
+                return modem
+
+        name = "gsm+benchmark"
+        rate = options.get('rate', 0.0)
+
+        start = get_time()
+        transport = Transport(name, {
+            'MODE': options.get('mode', 'text'),
+            'LOG_LEVEL': 'ERROR',
+            })
+
+        try:
+            # each message has a distinct text such that its
+            # submission can be matched to its creation time
+            created = {}
+            for i in xrange(count):
+                body = "%s %d" % (text, i)
+                created[body] = get_time()
+                Outgoing.from_uri(
+                    "%s://2567%08d" % (name, i % 100), text=body)
+                if rate:
+                    sleep(1.0 / rate)
+
+            deadline = start + options.get('timeout', 600.0)
+            while len(modem.submitted) < count and get_time() < deadline:
+                sleep(0.05)
+
+            submitted = list(modem.submitted)
+            if not submitted:
+                print "No messages were sent."
+                return
+
+            elapsed = submitted[-1] - start
+            latencies = [time - created[message.text] for (message, time)
+                         in zip(modem.sent, submitted)
+                         if message.text in created]
+            intervals = [b - a for (a, b) in zip(submitted, submitted[1:])]
+
+            print "%d message(s) in %.2f seconds " \
+                  "(%.1f messages/second)." % (
+                len(submitted), elapsed, len(submitted) / elapsed)
+            if latencies:
+                latencies.sort()
+                print "Latency from creation to submission: %.1f ms on " \
+                      "average, %.1f ms median (%.1f ms at most)." % (
+                    1000 * sum(latencies) / len(latencies),
+                    1000 * latencies[len(latencies) // 2],
+                    1000 * latencies[-1])
+            if intervals:
+                print "Inter-send interval: %.1f ms on average " \
+                      "(%.1f ms at most)." % (
+                    1000 * sum(intervals) / len(intervals),
+                    1000 * max(intervals))
+
+            # measure commands issued while there's nothing to do
+            idle = options.get('idle', 5.0)
+            commands = modem.commands
+            sleep(idle)
+            print "Polling: %.1f command(s) per second while idle." % (
+                (modem.commands - commands) / idle)
+        finally:
+            transport.stop()
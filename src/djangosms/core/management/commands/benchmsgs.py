@@ -0,0 +1,32 @@
+from optparse import make_option
+from time import time as get_time
+
+from django.core.management.base import BaseCommand
+
+from djangosms.core.transports import Message
+
+class Command(BaseCommand):
+    args = '[text]'
+    help = 'Measures the number of messages per second handled by ' \
+           'the system (use with a scratch database)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', dest='count', type='int', default=1000,
+                    help='Number of messages to handle'),
+        make_option('--atomic', dest='atomic', action='store_true',
+                    default=False,
+                    help='Handle each message in a single transaction'),
+        )
+
+    def handle(self, text="+echo benchmark", **options):
+        count = options.get('count', 1000)
+        transport = Message("benchmark", {
+            'ATOMIC': options.get('atomic', False)})
+
+        start = get_time()
+        for i in xrange(count):
+            transport.incoming(str(i % 100), text)
+        elapsed = get_time() - start
+
+        print "%d message(s) in %.2f seconds (%.1f messages/second)." % (
+            count, elapsed, count / elapsed)
@@ -1,4 +1,14 @@
+from datetime import datetime
+
+from django.conf import settings
 from django.db import models
+from django.db.models import signals
+
+from .lru import LRUCache
+from .segmentation import plan
+
+# maps connection uri to user id for recently seen connections
+_connections = LRUCache(getattr(settings, 'CONNECTION_CACHE_SIZE', 0))
 
 class User(models.Model):
     """An authenticated user.
@@ -7,15 +17,22 @@ class User(models.Model):
     means of authentication. Since users may use different devices, we
     record a set of :class:`Connection` objects that each authenticate
     a user.
+
+    The time and connection (URI) of the latest incoming message are
+    recorded in ``last_seen`` and ``last_uri`` as messages arrive (use
+    the ``backfillusers`` command for existing data).
     """
 
+    last_seen = models.DateTimeField(null=True, db_index=True)
+    last_uri = models.CharField(max_length=30, null=True)
+
     connections = ()
 
     @classmethod
     def from_uri(cls, uri, **kwargs):
         user = cls(**kwargs)
         user.save()
-        connection, created = Connection.objects.get_or_create(uri=uri)
+        connection = Connection.from_uri(uri)
         user.connections.add(connection)
         return user
 
@@ -23,12 +40,23 @@ class User(models.Model):
     def most_recent_connection(self):
         """Returns most recently used connection."""
 
+        if self.last_uri is not None:
+            return self.last_connection
+
         query = Incoming.objects.filter(connection__in=self.connections.all())
         try:
             return query.latest().connection
         except Incoming.DoesNotExist:
             return self.connections.order_by('-pk')[0]
 
+    @property
+    def last_connection(self):
+        """Return connection of the latest incoming message, or
+        ``None`` if not known."""
+
+        if self.last_uri is not None:
+            return Connection(uri=self.last_uri, user_id=self.pk)
+
     def __unicode__(self):
         return "User (%d) @ %s" % (
             self.pk, "; ".join(map(str, self.connections.all())))
@@ -58,6 +86,24 @@ class Connection(models.Model):
     def __unicode__(self):
         return self.ident
 
+    @classmethod
+    def from_uri(cls, uri):
+        """Return connection for ``uri``, creating it if required.
+
+        Recently used connections are kept in a least-recently-used
+        cache (the ``CONNECTION_CACHE_SIZE`` setting, disabled by
+        default) such that a message from a known sender does not
+        require a query.
+        """
+
+        user_id = _connections.get(uri, cls)
+        if user_id is not cls:
+            return cls(uri=uri, user_id=user_id)
+
+        connection, created = cls.objects.get_or_create(uri=uri)
+        _connections.set(uri, connection.user_id)
+        return connection
+
     @property
     def transport(self):
         """Return transport name."""
@@ -70,6 +116,52 @@ class Connection(models.Model):
 
         return self.uri.split('://', 1)[1]
 
+def on_change_connection(sender=None, instance=None, **kwargs):
+    _connections.discard(instance.uri)
+
+def on_pre_save_connection(sender=None, instance=None, **kwargs):
+    # remember the previous owner of a connection which is moved to
+    # another user
+    try:
+        previous = Connection.objects.get(pk=instance.uri).user_id
+    except Connection.DoesNotExist:
+        return
+    if previous is not None and previous != instance.user_id:
+        instance._previous_user_id = previous
+
+def on_save_connection(sender=None, instance=None, **kwargs):
+    previous = instance.__dict__.pop('_previous_user_id', None)
+    if previous is not None:
+        _replace_last_uri(previous, instance.uri)
+
+    # for a user who has not been seen yet (e.g. on registration), the
+    # connection which sorts last is the most recent (as in
+    # :func:`latest_connections`)
+    if instance.user_id is not None:
+        User.objects.filter(pk=instance.user_id, last_seen=None).filter(
+            models.Q(last_uri=None) | models.Q(last_uri__lt=instance.uri)
+            ).update(last_uri=instance.uri)
+
+def on_delete_connection(sender=None, instance=None, **kwargs):
+    if instance.user_id is not None:
+        _replace_last_uri(instance.user_id, instance.uri)
+
+def _replace_last_uri(user_id, uri):
+    # the connection no longer belongs to the user; if it was the
+    # most recently used, the latest of the remaining connections (if
+    # any) takes its place
+    users = User.objects.filter(pk=user_id, last_uri=uri)
+    if users.exists():
+        recent = latest_connections(users)
+        last_uri = recent.get(user_id, (None, None))[0]
+        users.update(last_uri=last_uri)
+
+signals.post_save.connect(on_change_connection, sender=Connection)
+signals.post_delete.connect(on_change_connection, sender=Connection)
+signals.pre_save.connect(on_pre_save_connection, sender=Connection)
+signals.post_save.connect(on_save_connection, sender=Connection)
+signals.post_delete.connect(on_delete_connection, sender=Connection)
+
 class CustomForeignKey(models.ForeignKey):
     def __init__(self, *args, **kwargs):
         self.column = kwargs.pop('column')
@@ -98,8 +190,7 @@ class Message(models.Model):
     @classmethod
     def from_uri(cls, uri, **kwargs):
         message = cls(**kwargs)
-        connection, created = Connection.objects.get_or_create(uri=uri)
-        message.connection = connection
+        message.connection = Connection.from_uri(uri)
         message.save()
         return message
 
@@ -109,18 +200,81 @@ class Message(models.Model):
 
         return self.connection.user
 
+# priority classes of outgoing messages (lower values are sent first)
+REPLY = 0
+NOTIFICATION = 1
+BULK = 2
+
+PRIORITIES = (
+    (REPLY, "Reply"),
+    (NOTIFICATION, "Notification"),
+    (BULK, "Bulk"),
+    )
+
 class Incoming(Message):
     """An incoming message."""
 
     suppress_responses = models.BooleanField(default=False)
     parts = ()
 
+def latest_connections(users):
+    """Return dictionary which maps the primary key of each of
+    ``users`` (a query) to a tuple ``(uri, time)`` with the most
+    recently used connection and the time of the latest incoming
+    message, in a single query.
+
+    The connection is that of the latest incoming message, or if
+    there is none, the connection which sorts last (the time is then
+    ``None``).
+    """
+
+    rows = Connection.objects.filter(user__in=users).annotate(
+        latest=models.Max('messages__incoming__time')).values_list(
+        'uri', 'user', 'latest')
+
+    recent = {}
+    for uri, user, latest in rows:
+        key = latest is not None, latest, uri
+        if user not in recent or key > recent[user]:
+            recent[user] = key
+
+    return dict((user, (uri, latest)) for (user, (
+        used, latest, uri)) in recent.items())
+
+def on_save_incoming(sender=None, instance=None, created=False, **kwargs):
+    # record the latest activity of the user; an older message (e.g.
+    # one which was queued) does not replace a more recent one
+    if not created or instance.time is None or instance.uri is None:
+        return
+
+    user_id = instance.connection.user_id
+    if user_id is None:
+        return
+
+    User.objects.filter(pk=user_id).filter(
+        models.Q(last_seen=None) | models.Q(last_seen__lte=instance.time)
+        ).update(last_seen=instance.time, last_uri=instance.uri)
+
+signals.post_save.connect(on_save_incoming, sender=Incoming)
+
 class Outgoing(Message):
     """An outgoing message."""
 
     in_response_to = models.ForeignKey("Request", related_name="responses", null=True)
     delivery_id = models.IntegerField(null=True)
     delivery = models.DateTimeField(null=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(null=True, db_index=True)
+    failed = models.BooleanField(default=False)
+    segments = models.IntegerField(null=True)
+    priority = models.IntegerField(choices=PRIORITIES, default=NOTIFICATION)
+
+    @property
+    def plan(self):
+        """Return encoding plan (see
+        :func:`djangosms.core.segmentation.plan`)."""
+
+        return plan(self.text)
 
     @property
     def delivered(self):
@@ -143,6 +297,60 @@ class Outgoing(Message):
             return self.uri == self.in_response_to.message.uri
         return False
 
+class Outbox(models.Model):
+    """Queue entry for an outgoing message which is pending delivery.
+
+    Entries are created when an outgoing message is saved for the
+    first time (unless responses are suppressed for the incoming
+    message) and removed when the message has been sent or has
+    failed (use the ``backfilloutbox`` command for messages which
+    were pending before the table was created). Transports claim work
+    from this table (in order of ``priority``, lower values first)
+    instead of scanning all outgoing messages; see
+    :mod:`djangosms.core.scheduler`.
+    """
+
+    message = models.OneToOneField(
+        Outgoing, primary_key=True, related_name="pending")
+    transport = models.CharField(max_length=30)
+    priority = models.IntegerField(choices=PRIORITIES, default=NOTIFICATION)
+    time = models.DateTimeField(default=datetime.now)
+
+    class Meta:
+        ordering = ['priority', 'message']
+
+    def __unicode__(self):
+        return u"%s (%s)" % (self.message, self.transport)
+
+def on_pre_save_outgoing(sender=None, instance=None, **kwargs):
+    # characters outside the GSM alphabet are replaced if the
+    # ``SUBSTITUTE_CHARACTERS`` setting is true
+    result = plan(instance.text, getattr(
+        settings, 'SUBSTITUTE_CHARACTERS', False))
+    instance.text = result.text
+    instance.segments = result.segments
+
+signals.pre_save.connect(on_pre_save_outgoing, sender=Outgoing)
+
+def on_save_outgoing(sender=None, instance=None, created=False, **kwargs):
+    if instance.time is not None or instance.failed:
+        Outbox.objects.filter(message=instance).delete()
+        return
+
+    if not created or instance.uri is None:
+        return
+
+    if instance.in_response_to_id is not None and \
+           instance.in_response_to.message is not None and \
+           instance.in_response_to.message.suppress_responses:
+        return
+
+    transport = instance.uri.split('://', 1)[0]
+    Outbox(message=instance, transport=transport,
+           priority=instance.priority).save()
+
+signals.post_save.connect(on_save_outgoing, sender=Outgoing)
+
 class Route(models.Model):
     name = models.CharField(max_length=50)
     slug = models.SlugField(unique=True, primary_key=True)
@@ -165,10 +373,13 @@ class Request(models.Model):
 
         self.respond(self.message.connection, text)
 
-    def respond(self, connection, text):
+    def respond(self, connection, text, priority=None):
         """Respond to this form.
 
         This method puts an outgoing message into the delivery queue.
+        Unless ``priority`` is given, a response to the sender of the
+        message is queued as a :data:`REPLY` and any other as a
+        :data:`NOTIFICATION`.
         """
 
         assert self.id is not None
@@ -180,5 +391,12 @@ class Request(models.Model):
 
         assert uri is not None
 
-        message = Outgoing(text=text, uri=uri, in_response_to=self)
+        if priority is None:
+            if self.message is not None and uri == self.message.uri:
+                priority = REPLY
+            else:
+                priority = NOTIFICATION
+
+        message = Outgoing(
+            text=text, uri=uri, in_response_to=self, priority=priority)
         message.save()
@@ -0,0 +1,142 @@
+from collections import deque
+from datetime import datetime
+from threading import Lock
+from time import time as get_time
+
+def parse_udh(data):
+    """Return ``(reference, total, sequence)`` for a user data header
+    (as a byte string) with a concatenation element, or ``None``.
+
+    Both the 8-bit and 16-bit reference formats are supported.
+    """
+
+    if not data:
+        return
+
+    length = ord(data[0])
+    header = data[1:length + 1]
+
+    i = 0
+    while i + 2 <= len(header):
+        iei, iel = ord(header[i]), ord(header[i + 1])
+        value = map(ord, header[i + 2:i + 2 + iel])
+        i += 2 + iel
+
+        if iei == 0x00 and iel == 3:
+            reference, total, sequence = value
+        elif iei == 0x08 and iel == 4:
+            reference = value[0] << 8 | value[1]
+            total, sequence = value[2:]
+        else:
+            continue
+
+        if 0 < sequence <= total:
+            return reference, total, sequence
+
+def concatenation_udh(reference, total, sequence):
+    """Return user data header (as a byte string) for a fragment of a
+    concatenated message with an 8-bit reference."""
+
+    return "".join(map(chr, (5, 0x00, 3, reference & 0xff, total, sequence)))
+
+class Reassembler(object):
+    """Buffer for the fragments of concatenated messages.
+
+    :param timeout: Incomplete messages expire after this number of seconds.
+
+    :param limit: Maximum number of buffered fragments; when exceeded, the oldest incomplete messages expire.
+
+    Fragments are keyed by sender and reference number. Expired
+    messages are not discarded; they're returned by :meth:`expired`
+    with the fragments that did arrive. Each fragment may carry a
+    token (e.g. the key of a spool record) which is returned with its
+    message. This implementation is thread-safe.
+    """
+
+    def __init__(self, timeout=300, limit=1000):
+        self.timeout = timeout
+        self.limit = limit
+        self._lock = Lock()
+        self._messages = {}
+        self._order = deque()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def deadline(self):
+        """Time (see :func:`time.time`) when the oldest incomplete
+        message expires, or ``None`` if there is none."""
+
+        with self._lock:
+            for key in self._order:
+                entry = self._messages.get(key)
+                if entry is not None:
+                    return entry[0] + self.timeout
+
+    def add(self, ident, text, time, reference, total, sequence,
+            token=None):
+        """Add fragment; returns a tuple ``(text, time, parts,
+        tokens)`` when the message is complete, otherwise ``None``.
+
+        The time of a complete message is that of its first fragment.
+        """
+
+        key = ident, reference, total
+        time = time or datetime.now()
+
+        with self._lock:
+            entry = self._messages.get(key)
+            if entry is None:
+                entry = self._messages[key] = [get_time(), time, {}, []]
+                self._order.append(key)
+
+            parts = entry[2]
+            if sequence not in parts:
+                self._count += 1
+            parts[sequence] = text
+            if token is not None:
+                entry[3].append(token)
+            if sequence == 1:
+                entry[1] = time
+
+            if len(parts) < total:
+                return
+
+            del self._messages[key]
+            self._count -= total
+
+        return self._join(entry)
+
+    def expired(self, now=None):
+        """Remove and return incomplete messages which have expired as
+        a list of tuples ``(ident, text, time, parts, tokens)``."""
+
+        if now is None:
+            now = get_time()
+
+        messages = []
+        with self._lock:
+            while self._order:
+                key = self._order[0]
+                entry = self._messages.get(key)
+                if entry is not None and entry[0] + self.timeout > now and \
+                       self._count <= self.limit:
+                    break
+
+                self._order.popleft()
+                if entry is None:
+                    continue
+
+                del self._messages[key]
+                self._count -= len(entry[2])
+                messages.append((key[0], ) + self._join(entry))
+
+        return messages
+
+    @staticmethod
+    def _join(entry):
+        started, time, parts, tokens = entry
+        parts = tuple(text for (sequence, text) in sorted(parts.items()))
+        return u"".join(parts), time, parts, tuple(tokens)
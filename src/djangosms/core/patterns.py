@@ -1,6 +1,21 @@
 import re
 import settings
 
+re_literal = re.compile(r'^\w+$')
+
+class Keyword(unicode):
+    """Regular expression pattern returned by :func:`keyword`.
+
+    The pattern string is annotated with the literal ``prefix`` and,
+    if the keyword subpattern is a plain alternation of words (e.g.
+    ``'register|reg'``), the lowercased ``words``. The router uses
+    this to look up candidate routes by keyword instead of trying
+    every pattern in turn.
+    """
+
+    prefix = ''
+    words = None
+
 def keyword(pattern, **kwargs):
     """Return regular expresssion pattern that matches a keyword prefix.
 
@@ -31,6 +46,16 @@ def keyword(pattern, **kwargs):
     else:
         remaining_re = '.'
 
-    regex = '^%s\s*(%s)(\s+(?P<%s>%s*)|$)' % (prefix_re, pattern, name, remaining_re)
+    regex = '^%s\s*(%s)(\s+(?P<%s>%s*)|$)' % (
+        prefix_re, pattern, name, remaining_re)
+    if isinstance(regex, str):
+        regex = regex.decode('utf-8')
+
+    regex = Keyword(regex)
+    regex.prefix = prefix or ''
+
+    words = pattern.split('|')
+    if all(map(re_literal.match, words)):
+        regex.words = tuple(word.lower() for word in words)
 
     return regex
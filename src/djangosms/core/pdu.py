@@ -0,0 +1,289 @@
+"""Encoding and decoding of SMS protocol data units (GSM 03.40).
+
+PDUs are exchanged with the modem as hexadecimal strings which start
+with the service centre address; when encoding, the address is left
+empty such that the modem uses the default of the SIM card.
+"""
+
+from datetime import datetime
+
+from .multipart import parse_udh
+from .segmentation import GSM_ALPHABET
+from .segmentation import GSM_EXTENSION
+
+# message type indicator (the two lowest bits of the first octet)
+DELIVER = 0
+SUBMIT = 1
+STATUS_REPORT = 2
+
+_extension = dict((code, c) for (c, code) in GSM_EXTENSION.items())
+
+class PDU(object):
+    """Decoded protocol data unit.
+
+    The ``type`` attribute is one of :data:`DELIVER`, :data:`SUBMIT`
+    and :data:`STATUS_REPORT`; other attributes depend on the type:
+
+    Deliver (incoming messages): ``number``, ``text``, ``date``, ``udh`` and ``part`` (see :func:`djangosms.core.multipart.parse_udh`).
+
+    Submit (outgoing messages): ``number``, ``text``, ``reference``, ``udh``, ``part``, ``validity`` and ``status_report``.
+
+    Status report: ``reference`` (of the message in question), ``number``, ``date`` (when the report was received by the service centre), ``discharge`` and ``status`` (see :attr:`delivered`).
+    """
+
+    udh = ""
+    part = None
+
+    def __init__(self, type, **kwargs):
+        self.type = type
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return "<PDU %d %s>" % (self.type, getattr(self, 'number', ''))
+
+    @property
+    def delivered(self):
+        """Return ``True`` if the status report confirms delivery;
+        ``False`` if delivery failed permanently or ``None`` if the
+        service centre is still trying."""
+
+        if self.status < 0x20:
+            return True
+        if self.status < 0x40:
+            return None
+        return False
+
+def encode_submit(number, text, encoding='gsm', udh="", dcs=0,
+                  validity=None, status_report=False):
+    """Return ``(pdu, length)`` for an outgoing message, where
+    ``length`` is the value for the ``AT+CMGS`` command.
+
+    The data coding scheme ``dcs`` is combined with the alphabet
+    given by ``encoding`` (either ``'gsm'`` or ``'ucs2'``); if set,
+    ``validity`` is a relative validity period (e.g. ``167`` for one
+    day).
+    """
+
+    first = SUBMIT
+    if validity not in (None, ""):
+        first |= 0x10
+    if status_report:
+        first |= 0x20
+    if udh:
+        first |= 0x40
+
+    octets = [first, 0x00] + _encode_address(number)
+    octets.append(0x00)
+    octets.append(dcs | (encoding == 'ucs2' and 0x08 or 0x00))
+    if validity not in (None, ""):
+        octets.append(int(validity))
+    octets.extend(_encode_user_data(text, encoding, udh))
+
+    tpdu = "".join("%02X" % octet for octet in octets)
+    return "00" + tpdu, len(octets)
+
+def encode_deliver(number, text, date, encoding='gsm', udh=""):
+    """Return PDU for an incoming message."""
+
+    first = DELIVER | (udh and 0x40 or 0x00)
+    octets = [first] + _encode_address(number)
+    octets.append(0x00)
+    octets.append(encoding == 'ucs2' and 0x08 or 0x00)
+    octets.extend(_encode_timestamp(date))
+    octets.extend(_encode_user_data(text, encoding, udh))
+    return "00" + "".join("%02X" % octet for octet in octets)
+
+def encode_status_report(reference, number, date, discharge, status=0):
+    """Return PDU for a status report."""
+
+    octets = [STATUS_REPORT, reference & 0xff] + _encode_address(number)
+    octets.extend(_encode_timestamp(date))
+    octets.extend(_encode_timestamp(discharge))
+    octets.append(status)
+    return "00" + "".join("%02X" % octet for octet in octets)
+
+def decode(pdu):
+    """Decode PDU given as a hexadecimal string; returns a
+    :class:`PDU` object."""
+
+    data = map(ord, pdu.strip().decode('hex'))
+
+    # skip service centre address
+    i = data[0] + 1
+
+    first = data[i]
+    type = first & 0x03
+    i += 1
+
+    if type == STATUS_REPORT:
+        reference = data[i]
+        number, i = _decode_address(data, i + 1)
+        date = _decode_timestamp(data[i:i + 7])
+        discharge = _decode_timestamp(data[i + 7:i + 14])
+        return PDU(type, reference=reference, number=number, date=date,
+                   discharge=discharge, status=data[i + 14])
+
+    if type == SUBMIT:
+        reference = data[i]
+        number, i = _decode_address(data, i + 1)
+        pid, dcs = data[i:i + 2]
+        i += 2
+        validity = None
+        vpf = first >> 3 & 0x03
+        if vpf == 2:
+            validity = data[i]
+            i += 1
+        elif vpf:
+            i += 7
+        kwargs = dict(reference=reference, validity=validity,
+                      status_report=bool(first & 0x20))
+    elif type == DELIVER:
+        number, i = _decode_address(data, i)
+        pid, dcs = data[i:i + 2]
+        kwargs = dict(date=_decode_timestamp(data[i + 2:i + 9]))
+        i += 9
+    else:
+        raise ValueError("Unsupported message type: %d." % type)
+
+    udh, text = _decode_user_data(data[i:], dcs, bool(first & 0x40))
+    return PDU(type, number=number, text=text, udh=udh,
+               part=parse_udh(udh), dcs=dcs, **kwargs)
+
+def to_septets(text):
+    """Return list of septets for ``text`` in the GSM alphabet; raises
+    ``ValueError`` for characters outside it."""
+
+    septets = []
+    for c in text:
+        code = GSM_EXTENSION.get(c)
+        if code is not None:
+            septets.extend((0x1b, code))
+        else:
+            index = GSM_ALPHABET.find(c)
+            if index < 0:
+                raise ValueError("Not in GSM alphabet: %r." % c)
+            septets.append(index)
+    return septets
+
+def from_septets(septets):
+    """Return text for a list of septets in the GSM alphabet."""
+
+    chars = []
+    escape = False
+    for septet in septets:
+        if escape:
+            chars.append(_extension.get(septet, u" "))
+            escape = False
+        elif septet == 0x1b:
+            escape = True
+        else:
+            chars.append(GSM_ALPHABET[septet])
+    return u"".join(chars)
+
+def pack(septets, fill=0):
+    """Pack septets into octets, starting after ``fill`` bits."""
+
+    octets = []
+    value = 0
+    bits = fill
+    for septet in septets:
+        value |= septet << bits
+        bits += 7
+        while bits >= 8:
+            octets.append(value & 0xff)
+            value >>= 8
+            bits -= 8
+    if bits:
+        octets.append(value)
+    return octets
+
+def unpack(octets, count, fill=0):
+    """Unpack ``count`` septets from octets, skipping ``fill``
+    bits."""
+
+    value = 0
+    for octet in reversed(octets):
+        value = value << 8 | octet
+    value >>= fill
+    return [value >> (7 * i) & 0x7f for i in range(count)]
+
+def _encode_address(number):
+    toa = 0x81
+    if number.startswith('+'):
+        toa = 0x91
+        number = number[1:]
+    digits = number + "F" * (len(number) % 2)
+    semi = "".join(digits[j + 1] + digits[j]
+                   for j in range(0, len(digits), 2))
+    return [len(number), toa] + map(ord, semi.decode('hex'))
+
+def _decode_address(data, i):
+    length, toa = data[i:i + 2]
+    size = (length + 1) // 2
+    octets = data[i + 2:i + 2 + size]
+
+    if toa >> 4 & 0x07 == 5:
+        # alphanumeric; a septet of padding may fill the last octet
+        septets = unpack(octets, length * 4 // 7)
+        if length * 4 % 7 == 0 and septets and septets[-1] == 0:
+            septets.pop()
+        number = from_septets(septets)
+    else:
+        number = "".join("%X%X" % (octet & 0x0f, octet >> 4)
+                         for octet in octets)[:length]
+        if toa >> 4 & 0x07 == 1:
+            number = "+" + number
+
+    return number, i + 2 + size
+
+def _encode_timestamp(date):
+    values = (date.year % 100, date.month, date.day,
+              date.hour, date.minute, date.second, 0)
+    return [int(("%02d" % value)[::-1], 16) for value in values]
+
+def _decode_timestamp(octets):
+    # the time zone (last octet) is ignored
+    values = [int(("%02X" % octet)[::-1]) for octet in octets[:6]]
+    year, month, day, hour, minute, second = values
+    return datetime(2000 + year, month, day, hour, minute, second)
+
+def _encode_user_data(text, encoding, udh):
+    if encoding == 'ucs2':
+        data = udh + text.encode('utf-16-be')
+        return [len(data)] + map(ord, data)
+
+    fill = (7 - len(udh) * 8 % 7) % 7
+    septets = to_septets(text)
+    length = (len(udh) * 8 + fill) // 7 + len(septets)
+    return [length] + map(ord, udh) + pack(septets, fill)
+
+def _decode_user_data(data, dcs, has_udh):
+    length = data[0]
+    data = data[1:]
+
+    udh = ""
+    if has_udh:
+        udh = "".join(map(chr, data[:data[0] + 1]))
+
+    if dcs & 0xc0 == 0:
+        alphabet = dcs >> 2 & 0x03
+    elif dcs & 0xf0 == 0xf0:
+        alphabet = dcs >> 2 & 0x01
+    elif dcs & 0xf0 == 0xe0:
+        alphabet = 2
+    else:
+        alphabet = 0
+
+    if alphabet == 0:
+        fill = (7 - len(udh) * 8 % 7) % 7
+        skip = (len(udh) * 8 + fill) // 7
+        octets = data[len(udh):]
+        text = from_septets(unpack(octets, length - skip, fill))
+    elif alphabet == 2:
+        octets = data[len(udh):length]
+        text = "".join(map(chr, octets)).decode('utf-16-be')
+    else:
+        octets = data[len(udh):length]
+        text = "".join(map(chr, octets)).decode('latin-1')
+
+    return udh, text
@@ -0,0 +1,124 @@
+import errno
+import socket
+import httplib
+
+from threading import Lock
+from time import time as get_time
+from urlparse import urlsplit
+
+class ConnectionPool(object):
+    """Pool of persistent (keep-alive) HTTP connections.
+
+    :param size: Maximum number of idle connections kept per host.
+
+    :param timeout: Idle connections are discarded after this number of seconds.
+
+    Connections are reused only if the server supports persistent
+    connections (HTTP/1.1).
+    """
+
+    def __init__(self, size=4, timeout=60.0):
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self._idle = {}
+        self._lock = Lock()
+
+    def request(self, url, timeout=None, headers={}):
+        """Make ``GET`` request; returns the tuple ``(status, body)``."""
+
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        selector = path or '/'
+        if query:
+            selector += '?' + query
+
+        key = scheme, netloc
+        while True:
+            connection, reused = self._acquire(key, timeout)
+
+            # a request on a reused connection is tried again
+            # (eventually with a new connection) only if it failed
+            # before the server could have handled it, i.e. the server
+            # had closed the idle connection (the request could not be
+            # sent, or the connection was closed or reset before any
+            # part of a response was read); timeouts are never retried
+            try:
+                connection.request('GET', selector, headers=headers)
+            except socket.timeout:
+                connection.close()
+                raise
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if reused:
+                    continue
+                raise
+
+            try:
+                response = connection.getresponse()
+            except httplib.BadStatusLine:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except socket.timeout:
+                connection.close()
+                raise
+            except socket.error, exc:
+                connection.close()
+                if reused and exc.errno == errno.ECONNRESET:
+                    continue
+                raise
+
+            try:
+                body = response.read()
+            except:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+
+            return response.status, body
+
+    def close(self):
+        """Close all idle connections."""
+
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.values():
+            for used, connection in connections:
+                connection.close()
+
+    def _acquire(self, key, timeout):
+        now = get_time()
+        with self._lock:
+            connections = self._idle.get(key, ())
+            while connections:
+                used, connection = connections.pop()
+                if now - used < self.timeout:
+                    connection.timeout = timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(timeout)
+                    return connection, True
+                connection.close()
+
+        scheme, netloc = key
+        if scheme == 'https':
+            factory = httplib.HTTPSConnection
+        else:
+            factory = httplib.HTTPConnection
+
+        self.created += 1
+        return factory(netloc, timeout=timeout), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.size:
+                connections.append((get_time(), connection))
+                return
+
+        connection.close()
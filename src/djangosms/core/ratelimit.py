@@ -0,0 +1,110 @@
+from threading import Lock
+from time import sleep
+from time import time as get_time
+
+from django.conf import settings
+
+_global = []
+
+class TokenBucket(object):
+    """Token bucket.
+
+    :param rate: Number of tokens added per second.
+
+    :param capacity: Maximum number of tokens (default is one
+    second's worth of tokens, but at least one).
+
+    Tokens are taken by reservation; when the bucket runs dry, the
+    caller is told how long to wait for its tokens instead of polling
+    for them. The total time spent waiting is kept in ``throttled``.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = capacity or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.throttled = 0.0
+        self._stamp = get_time()
+        self._lock = Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens from the bucket; returns the number of seconds
+        to wait until they're available."""
+
+        with self._lock:
+            now = get_time()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self._stamp) * self.rate) - tokens
+            self._stamp = now
+
+            if self.tokens >= 0:
+                return 0.0
+
+            delay = -self.tokens / self.rate
+            self.throttled += delay
+            return delay
+
+class RateLimiter(object):
+    """Rate limiter for a transport.
+
+    :param rate: Messages per second (or ``None`` for no limit).
+
+    :param burst: Burst size (see the ``capacity`` of :class:`TokenBucket`).
+
+    :param prefixes: Dictionary which maps destination prefixes to a
+    rate (messages per second); the longest matching prefix applies.
+
+    The global rate limit (messages per second for all transports) is
+    configured using the ``SEND_RATE`` setting.
+    """
+
+    def __init__(self, rate=None, burst=None, prefixes={}):
+        self.buckets = []
+        if rate:
+            self.buckets.append(TokenBucket(rate, burst))
+
+        self.prefixes = sorted(
+            ((prefix, TokenBucket(value, burst))
+             for (prefix, value) in prefixes.items()),
+            key=lambda (prefix, bucket): -len(prefix))
+
+        self.throttled = 0.0
+
+    def acquire(self, *idents):
+        """Wait until a message may be sent to each of the provided
+        destinations; returns the number of seconds waited."""
+
+        count = len(idents)
+        buckets = [(bucket, count) for bucket in self.buckets]
+
+        bucket = global_bucket()
+        if bucket is not None:
+            buckets.append((bucket, count))
+
+        if self.prefixes:
+            counts = {}
+            for ident in idents:
+                for prefix, bucket in self.prefixes:
+                    if ident.startswith(prefix):
+                        counts[bucket] = counts.get(bucket, 0) + 1
+                        break
+            buckets.extend(counts.items())
+
+        delay = max([0.0] + [
+            bucket.reserve(tokens) for (bucket, tokens) in buckets])
+
+        if delay > 0:
+            self.throttled += delay
+            sleep(delay)
+
+        return delay
+
+def global_bucket():
+    """Return the token bucket for the ``SEND_RATE`` setting, or
+    ``None`` if it's not set."""
+
+    if not _global:
+        rate = getattr(settings, 'SEND_RATE', None)
+        _global.append(rate and TokenBucket(rate) or None)
+    return _global[0]
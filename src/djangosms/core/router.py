@@ -1,5 +1,11 @@
 import re
+import sys
 
+from datetime import datetime
+from traceback import format_exc
+from warnings import warn
+
+from django.db.models import signals
 from django.dispatch import Signal
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
@@ -8,11 +14,15 @@ from django.utils.importlib import import_module
 
 from .models import Route
 from .models import Request
+from .transaction import atomic
+from .transaction import has_savepoints
 
 pre_handle = Signal(providing_args=["error", "result"])
 post_handle = Signal(providing_args=["error"])
 
 _cache = {}
+_dispatcher_cache = {}
+_route_cache = {}
 
 _camelcase_to_underscore = lambda str: re.sub(
     '(((?<=[a-z])[A-Z])|([A-Z](?![A-Z]|$)))', '_\\1', str).lower().strip('_')
@@ -46,10 +56,102 @@ def _compile_routes(table):
 
         routes.append((regex, handler))
 
+    _load_routes([handler for regex, handler in routes])
     return routes
 
 compile_routes = memoize(_compile_routes, _cache, 1)
 
+class Dispatcher(object):
+    """Keyword index for a routing table.
+
+    Routes defined using :func:`djangosms.core.patterns.keyword` with
+    a plain alternation of words are indexed on these words (for each
+    keyword prefix); all other routes are always candidates. This
+    means that the number of regular expressions tried for a message
+    does not grow with the number of keyword routes.
+    """
+
+    def __init__(self, table):
+        self.routes = compile_routes(table)
+        self.fallback = []
+
+        index = {}
+        for position, (pattern, handler) in enumerate(table):
+            words = getattr(pattern, 'words', None)
+            if words is None:
+                self.fallback.append(position)
+                continue
+
+            positions = index.setdefault(pattern.prefix, {})
+            for word in words:
+                positions.setdefault(word, []).append(position)
+
+        self.index = [
+            (re.compile(r'^%s\s*(\S+)' % re.escape(prefix)), positions)
+            for prefix, positions in index.items()]
+
+    def candidates(self, text):
+        """Return the routes that may match ``text``, in table order."""
+
+        positions = list(self.fallback)
+        for regex, words in self.index:
+            match = regex.match(text)
+            if match is not None:
+                positions.extend(words.get(match.group(1).lower(), ()))
+
+        positions.sort()
+        return [self.routes[position] for position in positions]
+
+compile_dispatcher = memoize(Dispatcher, _dispatcher_cache, 1)
+
+def _load_routes(handlers):
+    slugs = {}
+    for handler in handlers:
+        slug = _camelcase_to_underscore(handler.__name__)
+        slugs.setdefault(slug, []).append(handler)
+        _route_cache[handler] = None
+
+    for route in Route.objects.filter(slug__in=slugs.keys()):
+        for handler in slugs[route.slug]:
+            _route_cache[handler] = route
+
+def _clear_route_cache(sender=None, **kwargs):
+    _route_cache.clear()
+
+signals.post_save.connect(_clear_route_cache, sender=Route)
+signals.post_delete.connect(_clear_route_cache, sender=Route)
+
+def resolve_route(handler):
+    """Return the :class:`Route <djangosms.core.models.Route>` record
+    for ``handler``, or ``None`` if there is no such record.
+
+    Lookups are cached in-process; the cache is cleared when a route
+    is saved or deleted.
+    """
+
+    try:
+        return _route_cache[handler]
+    except KeyError:
+        pass
+
+    slug = _camelcase_to_underscore(handler.__name__)
+    try:
+        route = Route.objects.get(slug=slug)
+    except Route.DoesNotExist:
+        route = None
+
+    _route_cache[handler] = route
+    return route
+
+def create_routes(table):
+    """Create missing :class:`Route <djangosms.core.models.Route>`
+    records for the handlers in the routing table."""
+
+    for regex, handler in compile_routes(tuple(table)):
+        slug = _camelcase_to_underscore(handler.__name__)
+        Route.objects.get_or_create(slug=slug, defaults={
+            'name': slug.replace('_', ' ').capitalize()})
+
 def split(remaining, table=None):
     """Match text with routing table.
 
@@ -57,6 +159,10 @@ def split(remaining, table=None):
     sequence. This table is either provided directly in the optional
     ``table`` argument, or looked up under the ``ROUTES`` key in the
     global Django settings.
+
+    Keyword routes are looked up using an index (see
+    :class:`Dispatcher`); the first matching route in table order
+    always wins.
     """
 
     if table is None:
@@ -66,13 +172,13 @@ def split(remaining, table=None):
             raise ImproperlyConfigured("No such setting: %s" % str(exc))
 
     table = tuple(table)
-    routes = compile_routes(table)
+    dispatcher = compile_dispatcher(table)
     excluded = set()
 
     while True:
         text = remaining.strip()
 
-        for regex, handler in routes:
+        for regex, handler in dispatcher.candidates(text):
             if handler in excluded:
                 continue
 
@@ -103,42 +209,90 @@ def route(message, table=None):
     """Route message into zero or more requests."""
 
     for match, handler in split(message.text, table):
-        try:
-            slug = _camelcase_to_underscore(handler.__name__)
-            route = Route.objects.get(slug=slug)
-        except Route.DoesNotExist:
-            route = None
+        if not _handle(message, match, handler):
+            break
+
+def route_many(messages, table=None):
+    """Route a sequence of messages.
+
+    All message texts are matched with the routing table before any
+    request is handled. The requests (and their responses) are then
+    handled in order and persisted in a single database transaction;
+    this is useful to process a backlog of messages. Responses are
+    sent when the transaction has been committed.
+
+    If a handler raises an error, the requests of that message are
+    rolled back and a warning is logged (unless in debug mode); the
+    other messages are not affected. If the database does not support
+    savepoints, each message is handled in a transaction of its own
+    instead.
+    """
 
-        request = Request(message=message, text=match.group(), route=route)
-        request.save()
+    matches = [(message, tuple(split(message.text, table)))
+               for message in messages]
 
-        pre_handle.send(sender=request, handler=handler)
-        error = None
+    if has_savepoints():
+        atomic(_handle_many, matches)
+    else:
+        _handle_many(matches)
 
+def _handle_many(matches):
+    for message, pairs in matches:
         try:
-            try:
-                response = handler(request, **match.groupdict())
-                if not isinstance(response, basestring) and callable(response):
-                    response = response()
-            except FormatError, error:
-                request.erroneous = True
-                request.save()
-                response = error.text
-            except StopError, error:
-                # this does not mean the message was erroneous; we
-                # just extract the (optional) response
-                response = error.text
-            except Exception, error:
-                # catch and re-raise to allow the ``post_handle``
-                # signal to receive the exception instance
+            atomic(_handle_all, message, pairs)
+        except:
+            if settings.DEBUG:
                 raise
-            if response is not None:
-                text = unicode(response)
-                request.respond(message.connection, text)
-            if error is not None:
-                break
-        finally:
-            post_handle.send(sender=request, error=error)
+
+            cls, exc, tb = sys.exc_info()
+            warn("%s ERROR [%s] - %s.\n\n%s" % (
+                datetime.now().isoformat(),
+                type(exc).__name__,
+                repr(message.text.encode('utf-8')),
+                format_exc(exc)))
+
+def _handle_all(message, pairs):
+    for match, handler in pairs:
+        if not _handle(message, match, handler):
+            break
+
+def _handle(message, match, handler):
+    """Handle a single request.
+
+    Returns ``False`` if the handler raised an error which means that
+    no further requests should be handled for the message.
+    """
+
+    route = resolve_route(handler)
+    request = Request(message=message, text=match.group(), route=route)
+    request.save()
+
+    pre_handle.send(sender=request, handler=handler)
+    error = None
+
+    try:
+        try:
+            response = handler(request, **match.groupdict())
+            if not isinstance(response, basestring) and callable(response):
+                response = response()
+        except FormatError, error:
+            request.erroneous = True
+            request.save()
+            response = error.text
+        except StopError, error:
+            # this does not mean the message was erroneous; we
+            # just extract the (optional) response
+            response = error.text
+        except Exception, error:
+            # catch and re-raise to allow the ``post_handle``
+            # signal to receive the exception instance
+            raise
+        if response is not None:
+            text = unicode(response)
+            request.respond(message.connection, text)
+        return error is None
+    finally:
+        post_handle.send(sender=request, error=error)
 
 class StopError(Exception):
     """Raised from within a handler to indicate that no further
@@ -0,0 +1,169 @@
+"""Scheduling of outgoing messages by priority class.
+
+Messages are sent in order of their priority class (see
+:data:`djangosms.core.models.PRIORITIES`), such that a large
+broadcast does not hold up interactive replies. To protect lower
+classes from starvation, a message which has waited for more than
+``max_wait`` seconds is promoted by one class, where it takes its
+turn by age. Promotion is by one class only, so a backlog of overdue
+bulk messages never holds up replies.
+
+The :class:`Scheduler` is an in-memory queue for transports which
+send from a thread pool; :func:`select` applies the same rules to
+entries in the outbox table.
+"""
+
+from collections import deque
+from datetime import datetime
+from datetime import timedelta
+from Queue import Empty
+from threading import Condition
+from threading import Lock
+from time import time as get_time
+
+from django.db.models import Count
+
+from .models import NOTIFICATION
+from .models import PRIORITIES
+
+class Scheduler(object):
+    """Priority queue of outgoing messages.
+
+    :param maxsize: If positive, :meth:`put` blocks while this number of messages are queued.
+
+    :param max_wait: Messages which have been queued for this number of seconds are promoted by one class.
+
+    The interface is a subset of that of :class:`Queue.Queue`. The
+    priority class is read from the ``priority`` attribute of each
+    message. ``None`` may be put into the queue to signal a consumer
+    to stop; it's returned only when no messages are queued.
+    """
+
+    def __init__(self, maxsize=0, max_wait=60.0):
+        self.maxsize = maxsize
+        self.max_wait = max_wait
+        self._queues = dict(
+            (priority, deque()) for (priority, title) in PRIORITIES)
+        self._count = 0
+        self._stop = 0
+        lock = Lock()
+        self._not_empty = Condition(lock)
+        self._not_full = Condition(lock)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def depth(self):
+        """Dictionary which maps each priority class to the number of
+        queued messages."""
+
+        with self._not_empty:
+            return dict((priority, len(queue))
+                        for (priority, queue) in self._queues.items())
+
+    def put(self, message):
+        """Queue message."""
+
+        with self._not_full:
+            if message is None:
+                self._stop += 1
+            else:
+                while self.maxsize > 0 and self._count >= self.maxsize:
+                    self._not_full.wait()
+                priority = getattr(message, 'priority', NOTIFICATION)
+                queue = self._queues.get(priority)
+                if queue is None:
+                    queue = self._queues[priority] = deque()
+                queue.append((get_time(), message))
+                self._count += 1
+            self._not_empty.notify()
+
+    def get(self, block=True):
+        """Remove and return the next message; raises
+        :class:`Queue.Empty` if ``block`` is false and the queue is
+        empty."""
+
+        with self._not_empty:
+            while not self._count and not self._stop:
+                if not block:
+                    raise Empty
+                self._not_empty.wait()
+
+            if not self._count:
+                self._stop -= 1
+                return
+
+            message = self._next()
+            self._count -= 1
+            self._not_full.notify()
+            return message
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def _next(self):
+        classes = sorted(self._queues)
+        deadline = get_time() - self.max_wait
+
+        # the head of each queue is the oldest message of its class
+        heads = []
+        for priority, queue in self._queues.items():
+            if queue:
+                time = queue[0][0]
+                if time <= deadline:
+                    rank = _promote(classes, priority)
+                else:
+                    rank = priority
+                heads.append((rank, time, priority))
+
+        priority = min(heads)[2]
+        return self._queues[priority].popleft()[1]
+
+def _promote(classes, priority):
+    """Return the class above ``priority`` in the sorted sequence
+    ``classes`` (or ``priority`` itself if it's the highest)."""
+
+    higher = [c for c in classes if c < priority]
+    if higher:
+        return higher[-1]
+    return priority
+
+def select(query, limit, max_wait=60.0, now=None):
+    """Return list of up to ``limit`` outbox entries from ``query``
+    in order of sending.
+
+    Entries are ordered by priority class and then by age; an entry
+    which has waited for more than ``max_wait`` seconds is promoted by
+    one class.
+    """
+
+    now = now or datetime.now()
+    deadline = now - timedelta(seconds=max_wait)
+    classes = sorted(priority for (priority, title) in PRIORITIES)
+
+    # no more than ``limit`` entries of any one class can be selected
+    entries = []
+    for priority in classes:
+        entries.extend(query.filter(priority=priority).order_by(
+            'time', 'message')[:limit])
+
+    def key(entry):
+        if entry.time <= deadline:
+            rank = _promote(classes, entry.priority)
+        else:
+            rank = entry.priority
+        return rank, entry.time, entry.message_id
+
+    entries.sort(key=key)
+    return entries[:limit]
+
+def depth(query):
+    """Return dictionary which maps each priority class to the number
+    of outbox entries in ``query``."""
+
+    counts = dict((priority, 0) for (priority, title) in PRIORITIES)
+    query = query.order_by().values('priority')
+    for row in query.annotate(count=Count('pk')):
+        counts[row['priority']] = row['count']
+    return counts
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# GSM 03.38 default alphabet; the index of a character is its septet
+GSM_ALPHABET = (
+    u"@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞ\x1bÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    u"¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà")
+
+# characters in the extension table (preceded by an escape septet)
+GSM_EXTENSION = {
+    u'\x0c': 0x0A, u'^': 0x14, u'{': 0x28, u'}': 0x29, u'\\': 0x2F,
+    u'[': 0x3C, u'~': 0x3D, u']': 0x3E, u'|': 0x40, u'€': 0x65,
+    }
+
+# replacements for common characters outside the GSM alphabet
+SUBSTITUTIONS = {
+    u'\t': u' ', u'\xa0': u' ', u'`': u"'", u'´': u"'",
+    u'‘': u"'", u'’': u"'", u'‚': u"'", u'“': u'"', u'”': u'"',
+    u'„': u'"', u'«': u'"', u'»': u'"', u'–': u'-', u'—': u'-',
+    u'−': u'-', u'…': u'...', u'•': u'-', u'ç': u'Ç',
+    u'á': u'a', u'â': u'a', u'ã': u'a', u'ê': u'e', u'ë': u'e',
+    u'í': u'i', u'î': u'i', u'ï': u'i', u'ó': u'o', u'ô': u'o',
+    u'õ': u'o', u'ú': u'u', u'û': u'u', u'Á': u'A', u'À': u'A',
+    u'Â': u'A', u'Ã': u'A', u'È': u'E', u'Ê': u'E', u'Ë': u'E',
+    u'Í': u'I', u'Ì': u'I', u'Î': u'I', u'Ï': u'I', u'Ó': u'O',
+    u'Ò': u'O', u'Ô': u'O', u'Õ': u'O', u'Ú': u'U', u'Ù': u'U',
+    u'Û': u'U',
+    }
+
+_gsm = frozenset(GSM_ALPHABET)
+
+# septets or UCS-2 code units per segment for (single, concatenated)
+# messages; the user data header of a concatenated message takes up
+# the difference
+LIMITS = {
+    'gsm': (160, 153),
+    'ucs2': (70, 67),
+    }
+
+class Plan(object):
+    """Encoding plan for the text of a message.
+
+    :param text: Message text (after substitution).
+
+    :param encoding: Either ``'gsm'`` (the GSM 7-bit default alphabet) or ``'ucs2'``.
+
+    :param parts: Text of each segment; a message with more than one part must be sent as a concatenated message.
+    """
+
+    def __init__(self, text, encoding, parts):
+        self.text = text
+        self.encoding = encoding
+        self.parts = parts
+
+    def __repr__(self):
+        return "<Plan %s x %d>" % (self.encoding, self.segments)
+
+    @property
+    def segments(self):
+        """Number of segments."""
+
+        return len(self.parts)
+
+def substitute(text, substitutions=SUBSTITUTIONS):
+    """Replace characters outside the GSM alphabet for which there's a
+    substitution."""
+
+    return u"".join(substitutions.get(c, c) for c in text)
+
+def gsm_length(c):
+    """Return the number of septets used for ``c`` in the GSM
+    alphabet, or ``None`` if it's not available."""
+
+    if c in _gsm:
+        return 1
+    if c in GSM_EXTENSION:
+        return 2
+
+def ucs2_length(c):
+    """Return the number of UCS-2 (UTF-16) code units used for
+    ``c``."""
+
+    return len(c.encode('utf-16-be')) // 2
+
+def plan(text, substitute_characters=False):
+    """Return :class:`Plan` for ``text``.
+
+    The GSM alphabet is used unless the text has characters outside
+    it (after substitution, if ``substitute_characters`` is set).
+    Segments never split an escaped character or a surrogate pair.
+    """
+
+    if substitute_characters:
+        text = substitute(text)
+
+    tokens = list(_tokenize(text))
+    if all(gsm_length(c) for c in tokens):
+        encoding, length = 'gsm', gsm_length
+    else:
+        encoding, length = 'ucs2', ucs2_length
+
+    single, concatenated = LIMITS[encoding]
+    if sum(map(length, tokens)) <= single:
+        return Plan(text, encoding, [text])
+
+    parts = []
+    part = []
+    used = 0
+    for c in tokens:
+        size = length(c)
+        if used + size > concatenated:
+            parts.append(u"".join(part))
+            part = []
+            used = 0
+        part.append(c)
+        used += size
+    parts.append(u"".join(part))
+
+    return Plan(text, encoding, parts)
+
+def _tokenize(text):
+    # yield characters, keeping surrogate pairs together
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if u'\ud800' <= c <= u'\udbff' and i + 1 < len(text):
+            c = text[i:i + 2]
+        yield c
+        i += len(c)
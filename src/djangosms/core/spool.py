@@ -0,0 +1,163 @@
+import os
+import errno
+
+from itertools import count
+from threading import Lock
+from time import time as get_time
+
+from django.utils import simplejson
+
+# keys of the records claimed by this process
+_held = set()
+
+class Spool(object):
+    """Durable queue backed by a local directory.
+
+    :param path: Spool directory (created if it does not exist).
+
+    Each record is written to a separate file; first into the ``tmp``
+    subdirectory, then renamed into ``new`` (renames are atomic). A
+    consumer claims a record by renaming it into ``cur``, prefixed by
+    the process id, and removes it when it has been processed. Any
+    number of processes may share a spool directory.
+
+    Records claimed by a process that is no longer running are put
+    back in the queue when the spool is opened; a consumer which can't
+    process a record may also :meth:`release` it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._names = []
+        self._counter = count()
+        self._lock = Lock()
+
+        for name in ('tmp', 'new', 'cur'):
+            try:
+                os.makedirs(os.path.join(path, name))
+            except OSError, exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+        self.recover()
+
+    @property
+    def depth(self):
+        """Number of unclaimed records."""
+
+        return len(os.listdir(os.path.join(self.path, 'new')))
+
+    @property
+    def lag(self):
+        """Age in seconds of the oldest unclaimed record (or ``0``)."""
+
+        names = os.listdir(os.path.join(self.path, 'new'))
+        if not names:
+            return 0.0
+        return max(0.0, get_time() - float(min(names).split('-', 1)[0]))
+
+    def put(self, record, claimed=False):
+        """Add record (any JSON-serializable object) to the queue.
+
+        If ``claimed`` is true, the record is claimed by the calling
+        process right away and the claim key is returned (this is
+        useful to journal work that's already in progress).
+        """
+
+        name = "%017.6f-%d-%d" % (get_time(), os.getpid(), self._counter.next())
+        path = os.path.join(self.path, 'tmp', name)
+
+        f = open(path, 'wb')
+        try:
+            f.write(simplejson.dumps(record))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+        if claimed:
+            key = "%d.%s" % (os.getpid(), name)
+            _held.add(key)
+            os.rename(path, os.path.join(self.path, 'cur', key))
+            return key
+
+        os.rename(path, os.path.join(self.path, 'new', name))
+        return name
+
+    def claim(self):
+        """Claim the oldest unclaimed record; returns the tuple ``(key,
+        record)`` or ``None`` if the queue is empty. The record must
+        be marked as :meth:`done` by the consumer."""
+
+        while True:
+            with self._lock:
+                if not self._names:
+                    self._names = sorted(
+                        os.listdir(os.path.join(self.path, 'new')),
+                        reverse=True)
+                    if not self._names:
+                        return
+                name = self._names.pop()
+
+            key = "%d.%s" % (os.getpid(), name)
+            path = os.path.join(self.path, 'cur', key)
+
+            _held.add(key)
+            try:
+                os.rename(os.path.join(self.path, 'new', name), path)
+            except OSError, exc:
+                _held.discard(key)
+                # claimed by another consumer
+                if exc.errno == errno.ENOENT:
+                    continue
+                raise
+
+            f = open(path, 'rb')
+            try:
+                return key, simplejson.loads(f.read())
+            finally:
+                f.close()
+
+    def done(self, key):
+        """Remove a claimed record."""
+
+        _held.discard(key)
+        try:
+            os.unlink(os.path.join(self.path, 'cur', key))
+        except OSError, exc:
+            # the record was put back and claimed elsewhere
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def release(self, key):
+        """Put a claimed record back in the queue."""
+
+        _held.discard(key)
+        pid, name = key.split('.', 1)
+        os.rename(os.path.join(self.path, 'cur', key),
+                  os.path.join(self.path, 'new', name))
+
+    def recover(self):
+        """Put back records claimed by processes that are no longer
+        running (records claimed by this process are put back only if
+        it no longer holds them, i.e. they were left by an earlier
+        process with the same id)."""
+
+        directory = os.path.join(self.path, 'cur')
+        for key in os.listdir(directory):
+            if key in _held:
+                continue
+
+            pid, name = key.split('.', 1)
+            pid = int(pid)
+            if pid != os.getpid():
+                try:
+                    os.kill(pid, 0)
+                except OSError, exc:
+                    if exc.errno != errno.ESRCH:
+                        continue
+                else:
+                    continue
+
+            os.rename(os.path.join(directory, key),
+                      os.path.join(self.path, 'new', name))
@@ -0,0 +1,2 @@
+CREATE INDEX core_outbox_claim ON core_outbox (transport, priority, message_id);
+CREATE INDEX core_outbox_wait ON core_outbox (transport, time);
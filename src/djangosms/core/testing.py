@@ -71,6 +71,248 @@ class Connection(object):
         text = "<<< " + text
         self._received.append(text)
 
+class Modem(object):
+    """GSM modem simulator.
+
+    Use this in place of a serial device to test the :class:`GSM
+    <djangosms.core.transports.GSM>` transport (in text or PDU mode)
+    without hardware. The ``conn`` attribute responds to AT commands
+    like a modem with command echo disabled; otherwise, the object
+    provides the interface of :class:`sms.Modem`.
+
+    :param latency: Time (in seconds) to process each command.
+
+    :param error_rate: Probability that a message submission fails.
+
+    :param arrival_rate: Number of incoming messages per second (sent from the ``senders`` phone numbers with the ``text`` string formatted with a sequence number).
+
+    Submitted messages are decoded and appended to the ``sent`` list
+    (the time of each submission is in ``submitted``); use
+    :meth:`deliver` and :meth:`report` to put incoming messages and
+    status reports in storage. The ``commands`` attribute counts the
+    commands processed.
+    """
+
+    strength = 20
+    error = False
+    indications = False
+    reports = False
+    senders = ["+2567%08d" % i for i in range(100)]
+    text = "+echo %d"
+
+    def __init__(self, latency=0.0, error_rate=0.0, arrival_rate=0.0,
+                 seed=None):
+        from random import Random
+        from threading import Lock
+        from time import time
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.arrival_rate = arrival_rate
+        self.conn = ModemConnection(self)
+        self.sent = []
+        self.submitted = []
+        self.storage = []
+        self.mode = 1
+        self.reference = 0
+        self.commands = 0
+        self.arrived = 0
+        self.started = time()
+        self._random = Random(seed)
+        self._lock = Lock()
+
+    def deliver(self, number, text, date=None, encoding='gsm', udh=""):
+        """Store incoming message."""
+
+        from datetime import datetime
+        from . import pdu
+        with self._lock:
+            self.storage.append(["REC UNREAD", pdu.encode_deliver(
+                number, text, date or datetime.now(), encoding, udh)])
+            index = len(self.storage)
+
+        if self.indications:
+            self.conn.unsolicited('+CMTI: "SM",%d' % index)
+
+    def report(self, reference, number, status=0, date=None):
+        """Issue status report for a submitted message (or store it
+        if status reports are not routed to the terminal)."""
+
+        from datetime import datetime
+        from . import pdu
+        date = date or datetime.now()
+        data = pdu.encode_status_report(reference, number, date, date, status)
+
+        if not self.reports:
+            with self._lock:
+                self.storage.append(["REC UNREAD", data])
+        elif self.mode == 0:
+            self.conn.unsolicited("+CDS: %d\r\n%s" % (len(data) // 2 - 1, data))
+        else:
+            stamp = date.strftime("%y/%m/%d,%H:%M:%S+00")
+            self.conn.unsolicited('+CDS: 6,%d,"%s",145,"%s","%s",%d' % (
+                reference, number, stamp, stamp, status))
+
+    def wait(self, timeout=None):
+        """Wait until there are messages in storage (or the timeout
+        expires)."""
+
+        from time import sleep
+        from time import time
+        self.arrive()
+        if self.storage or not timeout:
+            return
+
+        delay = timeout
+        if self.arrival_rate:
+            next = self.started + (self.arrived + 1) / float(self.arrival_rate)
+            delay = min(delay, max(0, next - time()))
+        sleep(delay)
+        self.arrive()
+
+    def messages(self):
+        """Return and remove stored incoming messages (text mode)."""
+
+        from . import pdu
+        self.process()
+        self.arrive()
+        messages = []
+        with self._lock:
+            for entry in self.storage:
+                message = pdu.decode(entry[1])
+                if message.type == pdu.DELIVER:
+                    messages.append(message)
+            del self.storage[:]
+        return messages
+
+    def send(self, number, text):
+        """Send message (text mode)."""
+
+        self.process()
+        return self.submit((number, text))
+
+    def arrive(self):
+        """Store messages which have arrived according to the arrival
+        rate."""
+
+        from time import time
+        if not self.arrival_rate:
+            return
+
+        due = int((time() - self.started) * self.arrival_rate)
+        while self.arrived < due:
+            self.deliver(self._random.choice(self.senders),
+                         self.text % self.arrived)
+            self.arrived += 1
+
+    def process(self):
+        from time import sleep
+        self.commands += 1
+        if self.latency:
+            sleep(self.latency)
+
+    def submit(self, data):
+        from time import time
+        from . import pdu
+        if self.error or self._random.random() < self.error_rate:
+            return "ERROR"
+
+        self.reference = (self.reference + 1) % 256
+        if self.mode == 0:
+            message = pdu.decode(data)
+        else:
+            number, text = data
+            message = pdu.PDU(pdu.SUBMIT, number=number, text=text)
+        message.reference = self.reference
+        self.sent.append(message)
+        self.submitted.append(time())
+        return "+CMGS: %d\r\n\r\nOK" % self.reference
+
+    def execute(self, command):
+        if command == "AT":
+            return "OK"
+        if command == "AT+CSQ":
+            return "+CSQ: %d,99\r\n\r\nOK" % self.strength
+        if command == "AT+GMI":
+            return "FAKE\r\n\r\nOK"
+        if command == "AT+CMGF=?":
+            return "+CMGF: (0,1)\r\n\r\nOK"
+        if command in ("AT+CMGF=0", "AT+CMGF=1"):
+            self.mode = int(command[-1])
+            return "OK"
+        if command == "AT+CMGL=4" and self.mode == 0:
+            self.arrive()
+            lines = []
+            with self._lock:
+                for i, entry in enumerate(self.storage):
+                    lines.append("+CMGL: %d,0,,%d\r\n%s" % (
+                        i + 1, len(entry[1]) // 2 - 1, entry[1]))
+                    entry[0] = "REC READ"
+            return "\r\n".join(lines + ["", "OK"])
+        if command == "AT+CMGD=0,2":
+            with self._lock:
+                self.storage[:] = [entry for entry in self.storage
+                                   if entry[0] == "REC UNREAD"]
+            return "OK"
+        if command.startswith("AT+CNMI="):
+            values = command[8:].split(',')
+            self.indications = values[1] != '0'
+            self.reports = values[3] == '1'
+            return "OK"
+        if command.startswith(("AT+CPMS=", "AT+CSMP=", "AT+CUSD=")) \
+               or command == "AT+CMGS=?":
+            return "OK"
+        return "ERROR"
+
+class ModemConnection(object):
+    """Serial connection to a :class:`Modem`."""
+
+    def __init__(self, modem):
+        self.modem = modem
+        self._input = ""
+        self._output = ""
+        self._command = None
+
+    def write(self, data):
+        self._input += data
+        while True:
+            if self._command is not None:
+                if "\x1a" not in self._input:
+                    break
+                data, self._input = self._input.split("\x1a", 1)
+                command, self._command = self._command, None
+                if command.startswith('AT+CMGS="'):
+                    data = command[9:-1], data
+                self.modem.process()
+                self._output += self.modem.submit(data) + "\r\n"
+                continue
+
+            if "\r" not in self._input:
+                break
+
+            command, self._input = self._input.split("\r", 1)
+            command = command.strip()
+            if not command:
+                continue
+
+            self.modem.process()
+            if command.startswith("AT+CMGS=") and command != "AT+CMGS=?":
+                self._command = command
+                self._output += "> "
+            else:
+                self._output += self.modem.execute(command) + "\r\n"
+
+    def unsolicited(self, code):
+        self._output += "\r\n%s\r\n" % code
+
+    def flush(self):
+        pass
+
+    def readall(self):
+        self.modem.arrive()
+        output, self._output = self._output, ""
+        return output
+
 class FormTestCase(TestCase):
     """Adds utility methods for testing forms."""
 
@@ -99,8 +341,7 @@ class FormTestCase(TestCase):
         time = datetime.utcnow()
         message = Incoming(text=text, time=time, uri=uri)
         from .models import Connection
-        message.connection, created = Connection.objects.get_or_create(uri=uri)
-        message.connection.save()
+        message.connection = Connection.from_uri(uri)
         message.save()
         request = message.requests.create(message=message, text=text)
         response = form(request).handle(**kwargs)
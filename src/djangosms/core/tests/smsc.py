@@ -0,0 +1,65 @@
+import socket
+
+from threading import Event
+from threading import Thread
+from BaseHTTPServer import HTTPServer
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class SMSC(object):
+    """Local stand-in for the HTTP interface of an SMS center
+    (e.g. Kannel's ``sendsms`` service).
+
+    Records the request paths and the number of TCP connections
+    accepted; persistent connections are supported. If ``stall`` is
+    set, requests are accepted but never answered.
+    """
+
+    stall = False
+
+    def __init__(self, status=202):
+        self.requests = []
+        self.connections = 0
+        self.resume = Event()
+
+        smsc = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                self.connection.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                smsc.connections += 1
+
+            def do_GET(self):
+                smsc.requests.append(self.path)
+                if smsc.stall:
+                    smsc.resume.wait()
+                    self.close_connection = 1
+                    return
+                body = "0: Accepted for delivery"
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/cgi-bin/sendsms' % \
+                   self.server.server_port
+
+        thread = Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+    def stop(self):
+        self.resume.set()
+        self.server.shutdown()
+        self.server.server_close()
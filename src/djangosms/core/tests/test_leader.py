@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+class LeaderLockTest(TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.path)
+
+    def test_exclusive(self):
+        from os.path import join
+        from djangosms.core.leader import LeaderLock
+        path = join(self.path, "lock")
+        leader = LeaderLock(path)
+        standby = LeaderLock(path)
+        self.assertTrue(leader.acquire())
+        self.assertFalse(standby.acquire())
+        self.assertFalse(standby.held)
+
+        leader.release()
+        self.assertTrue(standby.acquire())
+        self.assertFalse(leader.acquire())
+
+    def test_take_over(self):
+        from os.path import join
+        from threading import Thread
+        from djangosms.core.leader import LeaderLock
+        path = join(self.path, "lock")
+        leader = LeaderLock(path)
+        standby = LeaderLock(path)
+        leader.acquire()
+
+        thread = Thread(target=standby.acquire, args=(True,))
+        thread.start()
+        leader.release()
+        thread.join(1.0)
+        self.assertTrue(standby.held)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+class LRUCacheTest(TestCase):
+    def test_eviction(self):
+        from djangosms.core.lru import LRUCache
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # 'a' is now the most recently used item
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_discard(self):
+        from djangosms.core.lru import LRUCache
+        cache = LRUCache(2)
+        cache.set('a', None)
+        self.assertTrue('a' in cache)
+        cache.discard('a')
+        self.assertFalse('a' in cache)
+        self.assertEqual(cache.get('a', 0), 0)
+
+    def test_disabled(self):
+        from djangosms.core.lru import LRUCache
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertEqual(len(cache), 0)
@@ -53,3 +53,68 @@ class MessagesTest(TestCase):
 
         self.assertTrue(len(messages), 1)
         self.assertTrue(messages[0].text, "Test")
+
+class OutboxTest(TestCase):
+    def test_backfilloutbox(self):
+        from datetime import datetime
+        from djangosms.core.models import BULK
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import Outbox
+        from djangosms.core.models import Outgoing
+        from djangosms.core.models import Request
+
+        Outgoing.objects.all().delete()
+        pending = Outgoing.from_uri("test://1", text="Test", priority=BULK)
+        sent = Outgoing.from_uri("test://1", text="Test")
+        failed = Outgoing.from_uri("test://1", text="Test")
+        failed.failed = True
+        failed.save()
+        message = Incoming.from_uri(
+            "test://1", text="Test", suppress_responses=True)
+        request = Request.objects.create(message=message, text="Test")
+        Outgoing.from_uri("test://1", text="Test", in_response_to=request)
+        queued = Outgoing.from_uri("test://2", text="Test")
+
+        # messages which were pending before upgrading are not queued
+        Outbox.objects.filter(message__in=[pending, sent]).delete()
+        Outgoing.objects.filter(pk=sent.pk).update(time=datetime.now())
+
+        from djangosms.core.management.commands.backfilloutbox import Command
+
+        out = StringIO.StringIO()
+        with stdout_redirected(out):
+            Command().handle(batch_size=1)
+
+        self.assertEqual(out.getvalue(), "Queued 1 message(s).\n")
+        entries = Outbox.objects.order_by('message')
+        self.assertEqual([entry.message for entry in entries],
+                         [pending, queued])
+        self.assertEqual((entries[0].transport, entries[0].priority),
+                         ("test", BULK))
+
+class UsersTest(TestCase):
+    def test_backfillusers(self):
+        from datetime import datetime
+        from djangosms.core.models import Connection
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import User
+
+        user = User.from_uri("test://1")
+        connection = Connection.from_uri("test://2")
+        connection.user = user
+        connection.save()
+        time = datetime(2010, 5, 1, 12, 34)
+        Incoming.from_uri("test://1", text="Test", time=time)
+
+        # forget recorded activity
+        User.objects.filter(pk=user.pk).update(last_seen=None, last_uri=None)
+
+        from djangosms.core.management.commands.backfillusers import Command
+
+        out = StringIO.StringIO()
+        with stdout_redirected(out):
+            Command().handle()
+
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual(user.last_seen, time)
+        self.assertEqual(user.most_recent_connection.uri, "test://1")
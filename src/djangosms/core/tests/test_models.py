@@ -6,6 +6,42 @@ class ConnectionTest(TestCase):
         connection = Connection(uri="test://123")
         self.assertEqual(str(connection), '123')
 
+class ConnectionCacheTest(TestCase):
+    def setUp(self):
+        from djangosms.core import models
+        from djangosms.core.lru import LRUCache
+        self._connections = models._connections
+        models._connections = LRUCache(10)
+
+    def tearDown(self):
+        from djangosms.core import models
+        models._connections = self._connections
+
+    def test_from_uri(self):
+        from djangosms.core.models import Connection
+        from django.db import connection as db
+        from django.conf import settings
+        debug, settings.DEBUG = settings.DEBUG, True
+        try:
+            Connection.from_uri("test://123")
+            count = len(db.queries)
+            connection = Connection.from_uri("test://123")
+            self.assertEqual(len(db.queries), count)
+        finally:
+            settings.DEBUG = debug
+        self.assertEqual(connection.user, None)
+
+    def test_invalidation(self):
+        from djangosms.core.models import Connection
+        from djangosms.core.models import User
+        Connection.from_uri("test://123")
+        user = User.from_uri("test://123")
+        self.assertEqual(Connection.from_uri("test://123").user, user)
+        Connection.objects.all().delete()
+        connection = Connection.from_uri("test://123")
+        self.assertEqual(Connection.objects.count(), 1)
+        self.assertEqual(connection.user, None)
+
 class MessageTest(TestCase):
     def test_ident(self):
         from djangosms.core.models import Connection
@@ -59,3 +95,119 @@ class OutgoingTest(TestCase):
         unsolicited.save()
         self.assertFalse(unsolicited.is_reply())
 
+    def test_segments(self):
+        from djangosms.core.models import Outgoing
+        message = Outgoing.from_uri("test://1", text=u"a" * 161)
+        self.assertEqual(message.segments, 2)
+        self.assertEqual(message.plan.encoding, 'gsm')
+
+        from django.conf import settings
+        substitute = getattr(settings, 'SUBSTITUTE_CHARACTERS', False)
+        settings.SUBSTITUTE_CHARACTERS = True
+        try:
+            message = Outgoing.from_uri("test://1", text=u"\u2018a\u2019")
+        finally:
+            settings.SUBSTITUTE_CHARACTERS = substitute
+        self.assertEqual(message.text, u"'a'")
+        self.assertEqual(message.segments, 1)
+
+
+class OutboxTest(TestCase):
+    def test_pending(self):
+        from datetime import datetime
+        from djangosms.core.models import Outgoing
+        from djangosms.core.models import Outbox
+
+        message = Outgoing.from_uri("test://1", text="test")
+        entry = Outbox.objects.get(message=message)
+        self.assertEqual(entry.message, message)
+        self.assertEqual(entry.transport, "test")
+
+        message.time = datetime.now()
+        message.save()
+        self.assertEqual(Outbox.objects.filter(message=message).count(), 0)
+
+    def test_suppressed(self):
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import Outbox
+
+        message = Incoming.from_uri(
+            "test://1", text="test", suppress_responses=True)
+        request = message.requests.create(text="test")
+        request.reply("test")
+        self.assertEqual(Outbox.objects.filter(
+            message__in_response_to=request).count(), 0)
+
+class RequestTest(TestCase):
+    def test_respond_priority(self):
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import Connection
+        from djangosms.core.models import Outbox
+        from djangosms.core.models import NOTIFICATION
+        from djangosms.core.models import REPLY
+
+        message = Incoming.from_uri("test://1", text="test")
+        request = message.requests.create(text="test")
+        request.reply("test")
+        request.respond(Connection.from_uri("test://2"), "test")
+
+        self.assertEqual(
+            [(entry.message.uri, entry.priority)
+             for entry in Outbox.objects.filter(
+                 message__in_response_to=request).order_by('message')],
+            [("test://1", REPLY), ("test://2", NOTIFICATION)])
+
+class UserTest(TestCase):
+    def test_last_seen(self):
+        from datetime import datetime
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import User
+
+        user = User.from_uri("test://1")
+        self.assertEqual(User.objects.get(pk=user.pk).last_uri, "test://1")
+
+        time = datetime(2010, 5, 1, 12, 34)
+        Incoming.from_uri("test://1", text="test", time=time)
+        self.assertEqual(User.objects.get(pk=user.pk).last_seen, time)
+
+        # an older message does not replace the latest activity
+        user.connections.create(uri="test://2")
+        Incoming.from_uri("test://2", text="test", time=datetime(2010, 1, 1))
+        user = User.objects.get(pk=user.pk)
+        self.assertEqual(user.last_seen, time)
+        self.assertEqual(user.most_recent_connection.uri, "test://1")
+
+    def test_last_uri_unseen(self):
+        from djangosms.core.models import User
+        from djangosms.core.models import latest_connections
+
+        # the connection which sorts last is the most recent
+        user = User.from_uri("test://2")
+        user.connections.create(uri="test://3")
+        user.connections.create(uri="test://1")
+        self.assertEqual(User.objects.get(pk=user.pk).last_uri, "test://3")
+        self.assertEqual(
+            latest_connections(User.objects.filter(pk=user.pk)),
+            {user.pk: ("test://3", None)})
+
+    def test_last_uri_moved(self):
+        from datetime import datetime
+        from djangosms.core.models import Connection
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import User
+
+        user = User.from_uri("test://1")
+        user.connections.create(uri="test://2")
+        Incoming.from_uri("test://1", text="test", time=datetime(2010, 1, 1))
+        Incoming.from_uri("test://2", text="test", time=datetime(2010, 5, 1))
+        self.assertEqual(User.objects.get(pk=user.pk).last_uri, "test://2")
+
+        # when the connection is moved to another user, the latest of
+        # the remaining connections is the most recent
+        other = User.from_uri("test://3")
+        other.connections.add(Connection.objects.get(uri="test://2"))
+        self.assertEqual(User.objects.get(pk=user.pk).last_uri, "test://1")
+
+        # a user without connections has no recent connection
+        Connection.objects.get(uri="test://1").delete()
+        self.assertEqual(User.objects.get(pk=user.pk).last_uri, None)
@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+class ParseTest(TestCase):
+    def test_8bit_reference(self):
+        from djangosms.core.multipart import parse_udh
+        self.assertEqual(parse_udh("\x05\x00\x03\xa7\x03\x02"), (0xa7, 3, 2))
+
+    def test_16bit_reference(self):
+        from djangosms.core.multipart import parse_udh
+        self.assertEqual(
+            parse_udh("\x06\x08\x04\x01\x02\x02\x01"), (0x0102, 2, 1))
+
+    def test_other_elements(self):
+        from djangosms.core.multipart import parse_udh
+        self.assertEqual(parse_udh("\x04\x01\x02\x00\x00"), None)
+        self.assertEqual(parse_udh("\x05\x00\x03\xa7\x02\x03"), None)
+        self.assertEqual(parse_udh(""), None)
+
+class ReassemblerTest(TestCase):
+    def test_complete(self):
+        from djangosms.core.multipart import Reassembler
+        fragments = Reassembler()
+        self.assertEqual(fragments.add("123", u"world", 2, 7, 2, 2, "b"), None)
+        self.assertEqual(len(fragments), 1)
+        text, time, parts, tokens = fragments.add(
+            "123", u"hello ", 1, 7, 2, 1, "a")
+        self.assertEqual(text, u"hello world")
+        self.assertEqual(time, 1)
+        self.assertEqual(parts, (u"hello ", u"world"))
+        self.assertEqual(tokens, ("b", "a"))
+        self.assertEqual(len(fragments), 0)
+
+    def test_senders(self):
+        from djangosms.core.multipart import Reassembler
+        fragments = Reassembler()
+        self.assertEqual(fragments.add("123", u"a", 1, 7, 2, 1), None)
+        self.assertEqual(fragments.add("456", u"b", 1, 7, 2, 2), None)
+        self.assertEqual(len(fragments), 2)
+
+    def test_timeout(self):
+        from time import time
+        from djangosms.core.multipart import Reassembler
+        fragments = Reassembler(timeout=60)
+        fragments.add("123", u"hello ", 1, 7, 3, 1)
+        fragments.add("123", u"!", 1, 7, 3, 3)
+        self.assertEqual(fragments.expired(), [])
+        self.assertTrue(time() < fragments.deadline <= time() + 60)
+        self.assertEqual(fragments.expired(time() + 61), [
+            ("123", u"hello !", 1, (u"hello ", u"!"), ())])
+        self.assertEqual(fragments.deadline, None)
+        self.assertEqual(len(fragments), 0)
+
+    def test_limit(self):
+        from djangosms.core.multipart import Reassembler
+        fragments = Reassembler(limit=2)
+        fragments.add("123", u"a", 1, 1, 2, 1)
+        fragments.add("123", u"b", 1, 2, 2, 1)
+        fragments.add("123", u"c", 1, 3, 2, 1)
+        self.assertEqual([text for (ident, text, time, parts, tokens)
+                          in fragments.expired()], [u"a"])
+        self.assertEqual(len(fragments), 2)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+class DecodeTest(TestCase):
+    def test_deliver(self):
+        from datetime import datetime
+        from djangosms.core import pdu
+        message = pdu.decode(
+            "07911326040000F0040B911346610089F6000020806291731408"
+            "0CC8F71D14969741F977FD07")
+        self.assertEqual(message.type, pdu.DELIVER)
+        self.assertEqual(message.number, "+31641600986")
+        self.assertEqual(message.text, u"How are you?")
+        self.assertEqual(message.date, datetime(2002, 8, 26, 19, 37, 41))
+        self.assertEqual(message.part, None)
+
+    def test_alphanumeric_sender(self):
+        from djangosms.core import pdu
+        message = pdu.decode(
+            "07911326040000F0040ED0E474D81C0EBB0100001110113152140"
+            "00BE474D81C0EBB5DE3771B")
+        self.assertEqual(message.number, "diafaan")
+
+    def test_status_report(self):
+        from datetime import datetime
+        from djangosms.core import pdu
+        date = datetime(2010, 5, 20, 4, 38, 2)
+        report = pdu.decode(pdu.encode_status_report(
+            42, "+256703945965", date, date, 0x40))
+        self.assertEqual(report.type, pdu.STATUS_REPORT)
+        self.assertEqual(report.reference, 42)
+        self.assertEqual(report.number, "+256703945965")
+        self.assertEqual(report.discharge, date)
+        self.assertEqual(report.delivered, False)
+
+class EncodeTest(TestCase):
+    def test_submit(self):
+        from djangosms.core import pdu
+        data, length = pdu.encode_submit("+46708251358", u"hellohello")
+        self.assertEqual(
+            data, "0001000B916407281553F800000AE8329BFD4697D9EC37")
+        self.assertEqual(length, 22)
+
+    def test_round_trip(self):
+        from djangosms.core import pdu
+        from djangosms.core.multipart import concatenation_udh
+        for encoding, text in (('gsm', u"[x] = {€}"),
+                               ('ucs2', u"‘hello’")):
+            for udh in ("", concatenation_udh(7, 2, 1)):
+                data, length = pdu.encode_submit(
+                    "256703945965", text, encoding, udh,
+                    validity=167, status_report=True)
+                message = pdu.decode(data)
+                self.assertEqual(message.type, pdu.SUBMIT)
+                self.assertEqual(message.number, "256703945965")
+                self.assertEqual(message.text, text)
+                self.assertEqual(message.validity, 167)
+                self.assertEqual(message.status_report, True)
+                self.assertEqual(message.part, udh and (7, 2, 1) or None)
+                self.assertEqual(length, len(data) // 2 - 1)
@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+class TokenBucketTest(TestCase):
+    def test_reserve(self):
+        from djangosms.core.ratelimit import TokenBucket
+        bucket = TokenBucket(10, 2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+
+        # the bucket is empty; we need to wait for a tenth of a second
+        delay = bucket.reserve()
+        self.assertTrue(0.05 < delay <= 0.1, delay)
+        self.assertEqual(bucket.throttled, delay)
+
+        # reservations queue up
+        self.assertTrue(bucket.reserve() > delay)
+
+class RateLimiterTest(TestCase):
+    def test_prefixes(self):
+        from djangosms.core.ratelimit import RateLimiter
+        limiter = RateLimiter(prefixes={'256': 100, '2567': 1000})
+        buckets = dict(limiter.prefixes)
+
+        self.assertEqual(limiter.acquire('256700000000'), 0.0)
+        self.assertEqual(buckets['2567'].tokens, 999)
+        self.assertEqual(buckets['256'].tokens, 100)
+
+        limiter.acquire('256100000000', '256100000001')
+        self.assertTrue(buckets['256'].tokens < 99)
+
+    def test_throttle(self):
+        from djangosms.core.ratelimit import RateLimiter
+        limiter = RateLimiter(rate=100, burst=1)
+        limiter.acquire('1')
+        delay = limiter.acquire('2')
+        self.assertTrue(delay > 0)
+        self.assertEqual(limiter.throttled, delay)
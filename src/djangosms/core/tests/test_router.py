@@ -1,4 +1,5 @@
 from django.test import TestCase
+from django.test import TransactionTestCase
 
 class PatternTest(TestCase):
     def test_match(self):
@@ -14,6 +15,46 @@ class PatternTest(TestCase):
         self.assertEqual(len(matches), 1)
         self.assertEqual(matches[0][1], handler)
 
+    def test_keyword_index(self):
+        from djangosms.core.router import split
+        from djangosms.core.patterns import keyword
+
+        def register(): pass
+        def echo(): pass
+        def other(): pass
+        def unknown(): pass
+
+        table = (
+            (keyword('register|reg', prefix='+'), register),
+            (r'^\+other', other),
+            (keyword('echo', prefix='+'), echo),
+            (keyword(r'\w+', prefix='+'), unknown),
+            )
+
+        handlers = [handler for match, handler in split(
+            "+REG bob +echo test +other +foo", table=table)]
+        self.assertEqual(handlers, [register, echo, other, unknown])
+
+        # keywords must be followed by whitespace or the end of input
+        handlers = [handler for match, handler in split(
+            "+registered", table=table)]
+        self.assertEqual(handlers, [unknown])
+
+    def test_keyword_index_table_order(self):
+        from djangosms.core.router import split
+        from djangosms.core.patterns import keyword
+
+        def first(): pass
+        def second(): pass
+
+        matches = tuple(split("+echo", table=(
+            (r'^\+', first),
+            (keyword('echo', prefix='+'), second),
+            )))
+
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0][1], first)
+
 class HandleTest(TestCase):
     def test_signals(self):
         from djangosms.core.router import pre_handle
@@ -114,3 +155,102 @@ class HandleTest(TestCase):
         self.assertEqual(message.requests.count(), 1)
         self.assertEqual(message.requests.get().erroneous, True)
 
+
+class RouteCacheTest(TestCase):
+    def test_route_record(self):
+        from djangosms.core.models import Incoming
+        from djangosms.core.models import Route
+        from djangosms.core.router import route
+
+        def cached_handler(request):
+            pass
+
+        table = ((r'^', cached_handler),)
+        record = Route(slug="cached_handler", name="Cached handler")
+        record.save()
+
+        message = Incoming.from_uri("test://test", text="")
+        route(message, table=table)
+        self.assertEqual(message.requests.get().route, record)
+
+        # deleting the record clears the cache
+        record.delete()
+        message = Incoming.from_uri("test://test", text="")
+        route(message, table=table)
+        self.assertEqual(message.requests.get().route, None)
+
+    def test_create_routes(self):
+        from djangosms.core.models import Route
+        from djangosms.core.router import create_routes
+
+        def created_handler(request):
+            pass
+
+        create_routes(((r'^', created_handler),))
+        self.assertEqual(
+            Route.objects.get(slug="created_handler").name, "Created handler")
+
+class RouteManyTest(TestCase):
+    def test_route_many(self):
+        from djangosms.core.router import pre_handle
+        from djangosms.core.router import FormatError
+
+        handled = []
+        def before_handle(sender=None, **kwargs):
+            handled.append(sender.text)
+        pre_handle.connect(before_handle)
+
+        def echo(request, text=None):
+            return text
+        def broken(request, **kwargs):
+            raise FormatError("error")
+
+        from djangosms.core.models import Incoming
+        messages = [
+            Incoming.from_uri("test://test", text="+echo 1 +break +echo 2"),
+            Incoming.from_uri("test://test", text="+echo 3"),
+            ]
+
+        from djangosms.core.router import route_many
+        try:
+            route_many(messages, table=(
+                (r'^\+echo\s(?P<text>[^+]*)', echo),
+                (r'^\+break', broken),
+                ))
+        finally:
+            pre_handle.disconnect(before_handle)
+
+        self.assertEqual(handled, ["+echo 1 ", "+break", "+echo 3"])
+        self.assertEqual(messages[0].requests.count(), 2)
+        self.assertEqual(messages[1].requests.get().responses.get().text, "3")
+
+class RouteManyErrorTest(TransactionTestCase):
+    def test_route_many_error(self):
+        def echo(request, text=None):
+            return text
+        def crash(request, **kwargs):
+            raise RuntimeError("crash")
+
+        from djangosms.core.models import Incoming
+        messages = [
+            Incoming.from_uri("test://test", text="+echo 1 +crash"),
+            Incoming.from_uri("test://test", text="+echo 2"),
+            ]
+
+        # the error is logged and the requests of the message are
+        # rolled back; the next message is still handled
+        import warnings
+        from djangosms.core.router import route_many
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            route_many(messages, table=(
+                (r'^\+echo\s(?P<text>[^+]*)', echo),
+                (r'^\+crash', crash),
+                ))
+
+        self.assertEqual(len(w), 1)
+        self.assertTrue("RuntimeError" in str(w[0].message))
+        self.assertEqual(messages[0].requests.count(), 0)
+        from djangosms.core.models import Outgoing
+        self.assertEqual(Outgoing.objects.filter(text="1 ").count(), 0)
+        self.assertEqual(messages[1].requests.get().responses.get().text, "2")
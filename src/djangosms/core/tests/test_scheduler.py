@@ -0,0 +1,105 @@
+from unittest import TestCase as UnitTestCase
+
+from django.test import TestCase
+
+class Message(object):
+    def __init__(self, text, priority):
+        self.text = text
+        self.priority = priority
+
+class SchedulerTest(UnitTestCase):
+    def test_priority(self):
+        from djangosms.core.models import BULK
+        from djangosms.core.models import NOTIFICATION
+        from djangosms.core.models import REPLY
+        from djangosms.core.scheduler import Scheduler
+        scheduler = Scheduler()
+        scheduler.put(Message("a", BULK))
+        scheduler.put(Message("b", NOTIFICATION))
+        scheduler.put(Message("c", BULK))
+        scheduler.put(Message("d", REPLY))
+        scheduler.put(None)
+        self.assertEqual(scheduler.depth,
+                         {REPLY: 1, NOTIFICATION: 1, BULK: 2})
+
+        texts = []
+        while True:
+            message = scheduler.get_nowait()
+            if message is None:
+                break
+            texts.append(message.text)
+        self.assertEqual(texts, ["d", "b", "a", "c"])
+
+        from Queue import Empty
+        self.assertRaises(Empty, scheduler.get_nowait)
+
+    def test_starvation(self):
+        from djangosms.core.models import BULK
+        from djangosms.core.models import NOTIFICATION
+        from djangosms.core.models import REPLY
+        from djangosms.core.scheduler import Scheduler
+        scheduler = Scheduler(max_wait=0)
+        scheduler.put(Message("a", BULK))
+        scheduler.put(Message("b", NOTIFICATION))
+        scheduler.put(Message("c", REPLY))
+
+        # all messages are overdue and promoted by one class; the
+        # bulk message takes its turn with notifications by age
+        self.assertEqual(
+            [scheduler.get().text for i in range(3)], ["b", "c", "a"])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_starvation_backlog(self):
+        from djangosms.core.models import BULK
+        from djangosms.core.models import REPLY
+        from djangosms.core.scheduler import Scheduler
+        scheduler = Scheduler(max_wait=0)
+        for i in range(1000):
+            scheduler.put(Message("bulk", BULK))
+        scheduler.put(Message("reply", REPLY))
+
+        # an overdue bulk backlog does not hold up replies
+        self.assertEqual(scheduler.get().text, "reply")
+        self.assertEqual(scheduler.depth[BULK], 1000)
+
+class SelectTest(TestCase):
+    def test_select(self):
+        from datetime import datetime
+        from datetime import timedelta
+        from djangosms.core.models import BULK
+        from djangosms.core.models import NOTIFICATION
+        from djangosms.core.models import Outbox
+        from djangosms.core.models import Outgoing
+        from djangosms.core.models import REPLY
+        from djangosms.core.scheduler import depth
+        from djangosms.core.scheduler import select
+
+        bulk = [Outgoing.from_uri("test://%d" % i, text="test",
+                                  priority=BULK) for i in range(3)]
+        reply = Outgoing.from_uri("test://4", text="test", priority=REPLY)
+        outbox = Outbox.objects.filter(message__in=bulk + [reply])
+        self.assertEqual(depth(outbox),
+                         {REPLY: 1, NOTIFICATION: 0, BULK: 3})
+
+        entries = select(outbox, 2)
+        self.assertEqual([entry.message for entry in entries],
+                         [reply, bulk[0]])
+
+        # entries which have waited too long are promoted by one
+        # class, which is not enough to go ahead of a reply
+        Outbox.objects.filter(message__in=bulk).update(
+            time=datetime.now() - timedelta(minutes=5))
+        entries = select(outbox, 2)
+        self.assertEqual([entry.message for entry in entries],
+                         [reply, bulk[0]])
+
+        # an overdue notification takes its turn with replies by age
+        notification = Outgoing.from_uri(
+            "test://5", text="test", priority=NOTIFICATION)
+        Outbox.objects.filter(message=notification).update(
+            time=datetime.now() - timedelta(minutes=10))
+        outbox = Outbox.objects.filter(
+            message__in=bulk + [reply, notification])
+        entries = select(outbox, 3)
+        self.assertEqual([entry.message for entry in entries],
+                         [notification, reply, bulk[0]])
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase
+
+class PlanTest(TestCase):
+    def test_gsm(self):
+        from djangosms.core.segmentation import plan
+        result = plan(u"a" * 160)
+        self.assertEqual(result.encoding, 'gsm')
+        self.assertEqual(result.segments, 1)
+
+        result = plan(u"a" * 161)
+        self.assertEqual(result.segments, 2)
+        self.assertEqual(map(len, result.parts), [153, 8])
+
+    def test_extension(self):
+        from djangosms.core.segmentation import plan
+        self.assertEqual(plan(u"[" * 80).segments, 1)
+
+        # escaped characters are not split across segments
+        result = plan(u"a" + u"[" * 80)
+        self.assertEqual(result.encoding, 'gsm')
+        self.assertEqual(map(len, result.parts), [77, 4])
+
+    def test_ucs2(self):
+        from djangosms.core.segmentation import plan
+        result = plan(u"’" + u"a" * 69)
+        self.assertEqual(result.encoding, 'ucs2')
+        self.assertEqual(result.segments, 1)
+        self.assertEqual(plan(u"’" + u"a" * 70).segments, 2)
+
+    def test_surrogate_pairs(self):
+        from djangosms.core.segmentation import plan
+        result = plan(u"\U0001f600" * 36)
+        self.assertEqual(result.segments, 2)
+        self.assertEqual(u"".join(result.parts), result.text)
+        for part in result.parts:
+            self.assertEqual(len(part.encode('utf-16-be')) % 4, 0)
+
+    def test_substitution(self):
+        from djangosms.core.segmentation import plan
+        result = plan(u"“Don’t” – café…", True)
+        self.assertEqual(result.text, u"\"Don't\" - café...")
+        self.assertEqual(result.encoding, 'gsm')
+        self.assertEqual(plan(u"“Don’t”").encoding, 'ucs2')
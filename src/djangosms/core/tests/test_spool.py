@@ -0,0 +1,66 @@
+from unittest import TestCase
+
+class SpoolTest(TestCase):
+    def setUp(self):
+        from tempfile import mkdtemp
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        from shutil import rmtree
+        rmtree(self.path)
+
+    def test_order(self):
+        from djangosms.core.spool import Spool
+        spool = Spool(self.path)
+        spool.put({'text': u"first"})
+        spool.put({'text': u"second"})
+        self.assertEqual(spool.depth, 2)
+
+        key, record = spool.claim()
+        self.assertEqual(record, {'text': u"first"})
+        self.assertEqual(spool.depth, 1)
+        spool.done(key)
+
+        key, record = spool.claim()
+        self.assertEqual(record, {'text': u"second"})
+        spool.done(key)
+
+        self.assertEqual(spool.claim(), None)
+        self.assertEqual(spool.lag, 0.0)
+
+    def test_recover(self):
+        from djangosms.core.spool import Spool
+        spool = Spool(self.path)
+        spool.put({'text': u"test"})
+        key, record = spool.claim()
+        self.assertEqual(spool.depth, 0)
+
+        # records held by this process are not put back
+        spool = Spool(self.path)
+        self.assertEqual(spool.depth, 0)
+
+        # the claimed record is put back when the spool is reopened
+        # by a process which does not hold it
+        from djangosms.core import spool as module
+        module._held.discard(key)
+        spool = Spool(self.path)
+        self.assertEqual(spool.depth, 1)
+        key, record = spool.claim()
+        self.assertEqual(record, {'text': u"test"})
+
+    def test_release(self):
+        from djangosms.core.spool import Spool
+        spool = Spool(self.path)
+        spool.put({'text': u"first"})
+        spool.put({'text': u"second"})
+
+        key, record = spool.claim()
+        spool.release(key)
+        self.assertEqual(spool.depth, 2)
+
+        # the released record is claimed again after the others
+        key, record = spool.claim()
+        self.assertEqual(record, {'text': u"second"})
+        spool.done(key)
+        key, record = spool.claim()
+        self.assertEqual(record, {'text': u"first"})
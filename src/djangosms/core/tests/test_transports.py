@@ -223,6 +223,330 @@ class HttpTest(TransactionTestCase):
         self.assertEquals(outgoing[0].text, u"test")
         self.assertEquals(outgoing[0].uri, u"http+sms://456")
 
+    def test_atomic_deferred_send(self):
+        from djangosms.core.transports import post_route
+
+        routed = []
+        def after_route(sender=None, **kwargs):
+            routed.append(sender)
+        post_route.connect(after_route)
+
+        # the response must be sent only after the ingest cycle
+        sent = []
+        def fetch(request=None, **kwargs):
+            sent.append(len(routed))
+            return True
+
+        http = self._make_http(fetch=fetch, atomic=True)
+        message = http.incoming('456', '+echo test')
+
+        self.assertEqual(sent, [1])
+        from djangosms.core.models import Outgoing
+        self.assertEqual(Outgoing.objects.get().sent, True)
+
+    def test_atomic_nested_error(self):
+        from djangosms.core.transaction import atomic
+        from djangosms.core.transaction import defer
+
+        calls = []
+        def fail():
+            defer(calls.append, "failed")
+            raise RuntimeError("error")
+        def run():
+            self.assertRaises(RuntimeError, atomic, fail)
+            defer(calls.append, "made")
+
+        # deferred calls of a failed nested call are not made (unless
+        # its changes can't be rolled back)
+        from djangosms.core.transaction import has_savepoints
+        atomic(run)
+        if has_savepoints():
+            self.assertEqual(calls, ["made"])
+        else:
+            self.assertEqual(calls, ["failed", "made"])
+
+    def test_send_queue(self):
+        sent = []
+        def fetch(request=None, **kwargs):
+            sent.append(request.get_full_url())
+            return False
+
+        http = self._make_http(fetch=fetch, senders=2, max_attempts=2)
+        http.incoming('456', '+echo test')
+
+        # stopping the transport drains the queue
+        http.stop()
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(http.queue, None)
+
+        # the failed attempt was recorded by the sender thread
+        from djangosms.core.models import Outbox
+        from djangosms.core.models import Outgoing
+        message = Outgoing.objects.get()
+        self.assertEqual(message.time, None)
+        self.assertEqual(message.attempts, 1)
+        self.assertFalse(message.failed)
+        self.assertNotEqual(message.next_attempt, None)
+        self.assertEqual(Outbox.objects.filter(message=message).count(), 1)
+
+    def test_send_queue_batch(self):
+        from threading import Event
+        from djangosms.core.models import Outgoing
+
+        release = Event()
+        queries = []
+        def fetch(request=None, **kwargs):
+            queries.append(dict(cgi.parse_qsl(
+                request.get_full_url().split('?', 1)[1])))
+            release.wait()
+            return True
+
+        http = self._make_http(fetch=fetch, senders=1, batch_size=10)
+        Outgoing.from_uri("http+sms://1", text="a")
+
+        # while the sender is busy, messages with different text are
+        # queued; they're coalesced into a single batch
+        while not queries:
+            time.sleep(0.01)
+        for ident, text in ((2, "a"), (3, "b"), (4, "a")):
+            Outgoing.from_uri("http+sms://%d" % ident, text=text)
+
+        release.set()
+        http.stop()
+        self.assertEqual(
+            [(query['text'], query['to']) for query in queries],
+            [("a", "1"), ("a", "2 4"), ("b", "3")])
+
+        # the messages were recorded as sent by the sender thread
+        from djangosms.core.models import Outbox
+        self.assertEqual(Outgoing.objects.filter(time=None).count(), 0)
+        self.assertEqual(Outbox.objects.count(), 0)
+
+    def test_batch_delivery(self):
+        from djangosms.core.models import Outgoing
+        messages = [Outgoing.from_uri("http+sms://%d" % i, text="test")
+                    for i in range(3)]
+
+        queries = []
+        def fetch(request=None, **kwargs):
+            queries.append(dict(cgi.parse_qsl(
+                request.get_full_url().split('?', 1)[1])))
+            return True
+
+        http = self._make_http(fetch=fetch, dlr_url='http://localhost')
+        http.send_many(messages)
+
+        self.assertEqual(len(queries), 1)
+        query = queries[0]
+        self.assertEqual(query['to'], "0 1 2")
+        self.assertEqual(Outgoing.objects.filter(time=None).count(), 0)
+
+        # delivery confirmation for a single recipient of the batch
+        delivery = datetime.datetime(2000, 1, 1)
+        request = self._make_request.get(
+            query['dlr-url'].replace(
+                '%d', '1').replace(
+                '%p', '1').replace(
+                '%T', str(time.mktime(delivery.timetuple()))))
+        response = self.view(request)
+        self.assertEqual(response.status_code, '200 OK')
+
+        delivered = Outgoing.objects.exclude(delivery=None)
+        self.assertEqual([message.uri for message in delivered],
+                         [u"http+sms://1"])
+        self.assertEqual(delivered[0].delivery, delivery)
+
+    def test_retry(self):
+        from djangosms.core.models import Outgoing
+
+        attempts = []
+        def fetch(request=None, **kwargs):
+            attempts.append(request)
+            return False
+
+        http = self._make_http(
+            fetch=fetch, max_attempts=3, retry_interval=3600)
+        http.incoming('456', '+echo test')
+
+        message = Outgoing.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.failed, False)
+        self.assertNotEqual(message.next_attempt, None)
+
+        # nothing is due yet
+        self.assertEqual(http.retry_due(), 0)
+
+        later = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.assertEqual(http.retry_due(later), 1)
+        self.assertEqual(Outgoing.objects.get().attempts, 2)
+
+        later += datetime.timedelta(days=1)
+        self.assertEqual(http.retry_due(later), 1)
+        message = Outgoing.objects.get()
+        self.assertEqual(message.attempts, 3)
+        self.assertEqual(message.failed, True)
+        self.assertEqual(message.next_attempt, None)
+        self.assertEqual(len(attempts), 3)
+
+        http.stop()
+
+    def test_spool(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        path = mkdtemp()
+
+        try:
+            http = self._make_http(spool=path, workers=0)
+            request = self._make_request.get("/", {
+                'from': '456',
+                'text': '+echo test',
+                'timestamp': str(time.mktime(
+                    datetime.datetime(1999, 12, 31).timetuple())),
+                })
+
+            response = self.view(request)
+            self.assertEqual(response.status_code, "200 OK")
+
+            from ..models import Incoming
+            self.assertEqual(Incoming.objects.count(), 0)
+            self.assertEqual(http.spool.depth, 1)
+            self.assertTrue(http.spool.lag >= 0)
+
+            # the record is kept if the message can't be stored
+            def broken(*args, **kwargs):
+                raise RuntimeError("database unavailable")
+            http._incoming = broken
+            self.assertRaises(RuntimeError, http.route_spooled)
+            self.assertEqual(http.spool.depth, 1)
+            del http._incoming
+
+            self.assertEqual(http.route_spooled(), 1)
+            self.assertEqual(http.spool.depth, 0)
+
+            message = Incoming.objects.get()
+            self.assertEqual(message.text, u"+echo test")
+            self.assertEqual(message.time, datetime.datetime(1999, 12, 31))
+            self.assertEqual(message.requests.get().responses.count(), 1)
+        finally:
+            rmtree(path)
+
+    def test_concatenated(self):
+        http = self._make_http()
+        timestamp = str(time.mktime(
+            datetime.datetime(1999, 12, 31).timetuple()))
+
+        for udh, text in (("050003a70202", "test"), ("050003a70201", "+echo ")):
+            request = self._make_request.get("/", {
+                'from': '456',
+                'text': text,
+                'udh': udh,
+                'timestamp': timestamp,
+                })
+            response = self.view(request)
+            self.assertEqual(response.status_code, "200 OK")
+
+        from ..models import Incoming
+        message = Incoming.objects.get()
+        self.assertEqual(message.text, u"+echo test")
+        self.assertEqual(message.requests.get().responses.count(), 1)
+
+    def test_spooled_fragments(self):
+        import os
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        path = mkdtemp()
+
+        try:
+            http = self._make_http(spool=path, workers=0)
+            timestamp = str(time.mktime(
+                datetime.datetime(1999, 12, 31).timetuple()))
+
+            def post(udh, text):
+                request = self._make_request.get("/", {
+                    'from': '456',
+                    'text': text,
+                    'udh': udh,
+                    'timestamp': timestamp,
+                    })
+                self.view(request)
+                return http.route_spooled()
+
+            # the record of a buffered fragment is kept
+            self.assertEqual(post("050003a70202", "test"), 1)
+            self.assertEqual(len(os.listdir(os.path.join(path, 'cur'))), 1)
+
+            # ... until the message has been routed
+            self.assertEqual(post("050003a70201", "+echo "), 1)
+            self.assertEqual(os.listdir(os.path.join(path, 'cur')), [])
+
+            from ..models import Incoming
+            self.assertEqual(Incoming.objects.get().text, u"+echo test")
+        finally:
+            rmtree(path)
+
+    def test_fragment_expiry_timer(self):
+        http = self._make_http(fragment_timeout=0.1)
+
+        expired = []
+        def expire_fragments():
+            expired.extend(http.fragments.expired())
+        http.expire_fragments = expire_fragments
+
+        # incomplete messages expire even if no messages arrive
+        http.incoming('456', u"test", part=(7, 2, 1))
+        for i in range(50):
+            if expired:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual([text for (ident, text, timestamp, parts, tokens)
+                          in expired], [u"test"])
+
+    def _confirm(self, message, delivery):
+        request = self._make_request.get("/", {
+            'status': '1',
+            'id': str(message.id),
+            'timestamp': str(time.mktime(delivery.timetuple())),
+            })
+        return self.view(request)
+
+    def test_buffered_delivery(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        path = mkdtemp()
+
+        from djangosms.core.models import Outgoing
+        messages = [Outgoing.from_uri("http+sms://%d" % i, text="test")
+                    for i in range(3)]
+
+        try:
+            http = self._make_http(
+                dlr_buffer=2, dlr_interval=3600, dlr_spool=path)
+            delivery = datetime.datetime(2000, 1, 1)
+
+            self._confirm(messages[0], delivery)
+            self.assertEqual(len(http.deliveries), 1)
+            self.assertEqual(Outgoing.objects.exclude(delivery=None).count(), 0)
+
+            # the buffer is applied when full
+            self._confirm(messages[1], delivery)
+            self.assertEqual(len(http.deliveries), 0)
+            self.assertEqual(Outgoing.objects.filter(delivery=delivery).count(), 2)
+
+            # buffered confirmations are journaled
+            self._confirm(messages[2], delivery)
+            from djangosms.core.delivery import DeliveryBuffer
+            from djangosms.core.spool import Spool
+
+            # reopen the journal as if the process had stopped
+            from djangosms.core import spool
+            spool._held.clear()
+            DeliveryBuffer(spool=Spool(path))
+            self.assertEqual(Outgoing.objects.filter(delivery=delivery).count(), 3)
+        finally:
+            http.deliveries.stop()
+            rmtree(path)
+
     def test_message_delivery_success(self):
         request = self._make_request.get("/", {
             'from': '456',
@@ -261,3 +585,291 @@ class HttpTest(TransactionTestCase):
         self.assertEqual(message.delivery, delivery)
         self.assertEqual(message.delivered, True)
         self.assertEqual(message.sent, True)
+
+class ConnectionPoolTest(TransactionTestCase):
+    def setUp(self):
+        super(ConnectionPoolTest, self).setUp()
+
+        from djangosms.core.tests.smsc import SMSC
+        self.smsc = SMSC()
+
+    def tearDown(self):
+        self.smsc.stop()
+
+        import gc
+        gc.collect()
+
+        super(ConnectionPoolTest, self).tearDown()
+
+    def _send(self, count, **options):
+        from djangosms.core.transports import HTTP
+        from djangosms.core.models import Outgoing
+
+        options['send_url'] = self.smsc.url
+        http = HTTP("http+smsc", options)
+
+        try:
+            for i in range(count):
+                Outgoing.from_uri("http+smsc://%d" % i, text="test")
+        finally:
+            if http.pool is not None:
+                http.pool.close()
+
+        self.assertEqual(len(self.smsc.requests), count)
+        self.assertEqual(Outgoing.objects.filter(time=None).count(), 0)
+
+    def test_persistent_connection(self):
+        self._send(20, pool_size=1)
+        self.assertEqual(self.smsc.connections, 1)
+
+    def test_no_pool(self):
+        self._send(20)
+        self.assertEqual(self.smsc.connections, 20)
+
+    def test_stalled_request(self):
+        import socket
+        from djangosms.core.pool import ConnectionPool
+        pool = ConnectionPool(size=1)
+
+        try:
+            self.assertEqual(pool.request(self.smsc.url)[0], 202)
+
+            # the server accepts the request and then stalls; the
+            # request is not sent again
+            self.smsc.stall = True
+            self.assertRaises(
+                socket.timeout, pool.request, self.smsc.url, timeout=0.2)
+            self.assertEqual(len(self.smsc.requests), 2)
+        finally:
+            pool.close()
+
+class GSMPoolTest(TransactionTestCase):
+    class Modem(object):
+        healthy = True
+        strength = None
+
+        def __init__(self, name, options, router=None):
+            self.name = name
+            self.device = options['device']
+            self.pool = options['pool']
+
+    def _make_pool(self):
+        from djangosms.core.transports import GSMPool
+
+        class Pool(GSMPool):
+            member = self.Modem
+
+        return Pool("gsm", {'DEVICES': ('a', 'b', 'c'), 'CLAIM_SIZE': 4})
+
+    def test_share(self):
+        from djangosms.core.models import Outgoing
+        for i in range(6):
+            Outgoing.from_uri("gsm://%d" % i, text="test")
+
+        pool = self._make_pool()
+        a, b, c = pool.members
+        a.strength, b.strength = 29, 9
+        c.healthy = False
+
+        self.assertEqual(c.pool, pool)
+        self.assertEqual(pool.claim(c), [])
+
+        # the strong modem gets three quarters of the pending messages
+        # (limited by the claim size), the weak modem one quarter
+        claimed = pool.claim(a)
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(len(pool.claim(b)), 1)
+        self.assertEqual(len(pool.claim(b)), 1)
+        self.assertEqual(pool.claim(b), [])
+
+        # released messages may be claimed again
+        pool.release(claimed)
+        self.assertEqual(pool.claim(b), claimed[:1])
+
+class GSMTest(TransactionTestCase):
+    @staticmethod
+    def _make_gsm(modem=None, **options):
+        from djangosms.core.transports import GSM
+        from djangosms.core.testing import Modem
+
+        class Transport(GSM):
+            def connect(self):
+                return modem or Modem()
+
+            def start(self):
+                pass
+
+        def echo(form, input):
+            return input
+
+        from djangosms.core.router import route
+        router = functools.partial(route, table=(
+            (r'^\+echo\s(?P<input>.*)', echo),
+            ))
+
+        options.setdefault('mode', 'pdu')
+        return Transport("gsm", options, router=router)
+
+    def _receive(self, gsm):
+        for message in gsm.receive():
+            gsm.incoming(message.number, message.text, message.date,
+                         part=message.part)
+
+    def _send(self, gsm):
+        from djangosms.core.models import Outbox
+        gsm.send_many([entry.message for entry in Outbox.objects.all()])
+
+    def test_setup(self):
+        gsm = self._make_gsm()
+        self.assertEqual(gsm.modem.mode, 0)
+        self.assertEqual(gsm.check_signal_strength(), 20)
+        self.assertTrue(gsm.healthy)
+
+    def test_indications(self):
+        gsm = self._make_gsm()
+        self.assertTrue(gsm.indications)
+        gsm._unread = False
+        gsm.modem.deliver("+256703945965", u"test")
+        gsm.read()
+        self.assertTrue(gsm._unread)
+
+    def test_concatenated(self):
+        from djangosms.core.multipart import concatenation_udh
+        gsm = self._make_gsm()
+        text = u"+echo \u2018" + u"x" * 80 + u"\u2019"
+        gsm.modem.deliver("+256703945965", text[:67], encoding='ucs2',
+                          udh=concatenation_udh(7, 2, 1))
+        gsm.modem.deliver("+256703945965", text[67:], encoding='ucs2',
+                          udh=concatenation_udh(7, 2, 2))
+        self._receive(gsm)
+
+        from djangosms.core.models import Incoming
+        self.assertEqual(Incoming.objects.get().text, text)
+
+        self._send(gsm)
+        parts = gsm.modem.sent
+        self.assertEqual([part.part[1:] for part in parts], [(2, 1), (2, 2)])
+        self.assertEqual(u"".join(part.text for part in parts), text[6:])
+        self.assertEqual(parts[0].number, "+256703945965")
+
+        from djangosms.core.models import Outgoing
+        message = Outgoing.objects.get()
+        self.assertEqual(message.delivery_id, parts[0].reference)
+        self.assertTrue(message.sent)
+
+    def test_text_mode(self):
+        gsm = self._make_gsm(mode='text')
+        self.assertEqual(gsm.modem.mode, 1)
+        gsm.modem.deliver("+256703945965", u"+echo test")
+        self._receive(gsm)
+        self._send(gsm)
+        self.assertEqual([message.text for message in gsm.modem.sent],
+                         [u"test"])
+
+    def test_send_error(self):
+        gsm = self._make_gsm(max_errors=1, log_level='critical')
+        gsm.modem.error = True
+        gsm.modem.deliver("+256703945965", u"+echo test")
+        self._receive(gsm)
+        self._send(gsm)
+        self.assertFalse(gsm.healthy)
+
+        from djangosms.core.models import Outgoing
+        self.assertFalse(Outgoing.objects.get().sent)
+
+    def test_receive_deliver_only(self):
+        from djangosms.core import pdu
+        gsm = self._make_gsm()
+        gsm.modem.deliver("+256703945965", u"test")
+
+        # a stored copy of a sent message is not an incoming message
+        data, length = pdu.encode_submit("+256703945965", u"sent")
+        gsm.modem.storage.append(["REC UNREAD", data])
+
+        messages = gsm.receive()
+        self.assertEqual([message.text for message in messages], [u"test"])
+
+    def test_send_exception(self):
+        from djangosms.core.models import Outgoing
+        gsm = self._make_gsm(log_level='critical')
+        first = Outgoing.from_uri("gsm://+256703945965", text=u"first")
+        Outgoing.from_uri("gsm://+256703945965", text=u"second")
+
+        # an error which is not a modem error does not stop sending
+        submit = gsm._submit_pdu
+        def broken(message):
+            if message.id == first.id:
+                raise ValueError(message.text)
+            return submit(message)
+        gsm._submit_pdu = broken
+
+        self._send(gsm)
+        self.assertEqual([message.text for message in gsm.modem.sent],
+                         [u"second"])
+        self.assertFalse(Outgoing.objects.get(pk=first.pk).sent)
+        self.assertTrue(Outgoing.objects.get(pk=first.pk).failed)
+        self.assertTrue(gsm.healthy)
+
+    def test_send_exception_claim(self):
+        from djangosms.core.models import Outbox
+        from djangosms.core.models import Outgoing
+        from djangosms.core.scheduler import select
+        gsm = self._make_gsm(log_level='critical')
+
+        # a full claim of messages which can't be encoded
+        bad = [Outgoing.from_uri("gsm://xyz%d" % i, text=u"bad")
+               for i in range(gsm.claim_size)]
+        good = Outgoing.from_uri("gsm://+256703945965", text=u"good")
+
+        for i in range(2):
+            gsm.send_many([entry.message for entry in select(
+                Outbox.objects.filter(transport=gsm.name).select_related(
+                    'message'), gsm.claim_size, gsm.max_wait)])
+
+        # failed messages leave the outbox and don't block the next
+        self.assertEqual([message.text for message in gsm.modem.sent],
+                         [u"good"])
+        self.assertTrue(Outgoing.objects.get(pk=good.pk).sent)
+        self.assertEqual(Outgoing.objects.filter(
+            pk__in=[message.pk for message in bad], failed=True).count(),
+                         gsm.claim_size)
+        self.assertEqual(Outbox.objects.count(), 0)
+
+    def test_simulator(self):
+        from time import sleep
+        from djangosms.core.testing import Modem
+        modem = Modem(error_rate=1.0, arrival_rate=1000.0, seed=0)
+        gsm = self._make_gsm(modem=modem)
+
+        sleep(0.01)
+        messages = gsm.receive()
+        self.assertTrue(len(messages) >= 10)
+        self.assertEqual(messages[0].text, u"+echo 0")
+        self.assertTrue(messages[0].number in modem.senders)
+
+        count = modem.commands
+        self.assertTrue(gsm.ping())
+        self.assertEqual(modem.commands, count + 1)
+        self.assertEqual(modem.submit(("123", u"test")), "ERROR")
+
+
+    def test_status_report(self):
+        from djangosms.core.models import Outgoing
+        for mode in ('pdu', 'text'):
+            Outgoing.objects.all().delete()
+            gsm = self._make_gsm(mode=mode, delivery=True, dlr_buffer=0)
+            self.assertTrue(gsm.modem.reports)
+            Outgoing.from_uri("gsm://+256703945965", text=u"test")
+            self._send(gsm)
+
+            message = Outgoing.objects.get()
+            self.assertFalse(message.delivered)
+
+            delivery = datetime.datetime(2010, 12, 31)
+            gsm.modem.report(message.delivery_id, "+256703945965",
+                             date=delivery)
+            gsm.read()
+
+            message = Outgoing.objects.get()
+            self.assertEqual(message.delivery, delivery)
+            self.assertEqual(gsm.references, {})
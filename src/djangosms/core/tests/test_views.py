@@ -0,0 +1,71 @@
+import datetime
+import time
+
+from django.test import TransactionTestCase
+from django.utils import simplejson
+
+class LoadMessagesTest(TransactionTestCase):
+    def setUp(self):
+        super(LoadMessagesTest, self).setUp()
+
+        from django.contrib.auth.models import User
+        User.objects.create_user("test", "test@localhost", "test")
+
+    def _post(self, messages, password="test"):
+        from django.test import Client
+        return Client().post("/loadmsgs", {
+            'username': "test",
+            'password': password,
+            'messages': simplejson.dumps(messages),
+            })
+
+    def test_unauthorized(self):
+        response = self._post([], password="wrong")
+        self.assertEqual(response.status_code, 401)
+
+    def test_load(self):
+        timestamp = time.mktime(datetime.datetime(1999, 12, 31).timetuple())
+        response = self._post([
+            {'from': "123", 'text': "first", 'timestamp': timestamp},
+            {'from': "123", 'text': "second"},
+            {'from': "456", 'text': "third", 'timestamp': timestamp},
+            ])
+
+        self.assertEqual(response.status_code, 200)
+        results = simplejson.loads(response.content)
+        self.assertEqual(len(results), 3)
+        self.assertTrue('error' in results[1])
+
+        from djangosms.core.models import Incoming
+        messages = [Incoming.objects.get(pk=results[i]['id']) for i in (0, 2)]
+        self.assertEqual([message.text for message in messages],
+                         [u"first", u"third"])
+        self.assertEqual(messages[0].uri, u"http+sms://123")
+        self.assertEqual(messages[0].suppress_responses, True)
+
+    def test_load_error(self):
+        from djangosms.core.transports import pre_route
+        def crash(sender=None, **kwargs):
+            if sender.text == u"crash":
+                raise RuntimeError("crash")
+        pre_route.connect(crash)
+
+        # the message fails after it has been stored
+        timestamp = time.mktime(datetime.datetime(1999, 12, 31).timetuple())
+        try:
+            response = self._post([
+                {'from': "123", 'text': "first", 'timestamp': timestamp},
+                {'from': "123", 'text': "crash", 'timestamp': timestamp},
+                {'from': "456", 'text': "third", 'timestamp': timestamp},
+                ])
+        finally:
+            pre_route.disconnect(crash)
+
+        results = simplejson.loads(response.content)
+        self.assertEqual(results[1], {'error': "RuntimeError: crash"})
+
+        from djangosms.core.models import Incoming
+        self.assertEqual(Incoming.objects.filter(text=u"crash").count(), 0)
+        self.assertEqual(
+            [Incoming.objects.get(pk=results[i]['id']).text for i in (0, 2)],
+            [u"first", u"third"])
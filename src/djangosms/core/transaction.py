@@ -0,0 +1,76 @@
+"""Transactions with deferred calls.
+
+Work which must not happen before the current transaction has been
+committed (e.g. sending a message which was saved in it) is passed to
+:func:`defer`; :func:`atomic` runs a function in a transaction and
+makes the deferred calls when it has been committed.
+"""
+
+from __future__ import absolute_import
+
+from threading import local
+
+from django.db import connection
+from django.db import transaction
+
+# calls deferred until the current atomic call is committed
+_pending = local()
+
+def defer(func, *args):
+    """Call ``func`` with ``args`` when the current :func:`atomic`
+    call (e.g. an atomic ingest cycle, see
+    :class:`~djangosms.core.transports.Message`) has been committed,
+    or immediately if there is none.
+    """
+
+    calls = getattr(_pending, 'calls', None)
+    if calls is None:
+        return func(*args)
+    calls.append((func, args))
+
+def atomic(func, *args):
+    """Call ``func`` with ``args`` in a database transaction; calls
+    deferred in the meantime (see :func:`defer`) are made when the
+    transaction has been committed.
+
+    Nested calls join the transaction already in progress; if such a
+    call raises an exception, its changes are rolled back to a
+    savepoint and its deferred calls are discarded. If the database
+    does not support savepoints (see :func:`has_savepoints`), the
+    changes can't be rolled back and the deferred calls are made
+    with the others.
+    """
+
+    calls = getattr(_pending, 'calls', None)
+    if calls is not None:
+        if not has_savepoints():
+            return func(*args)
+
+        sid = transaction.savepoint()
+        count = len(calls)
+        try:
+            result = func(*args)
+        except:
+            transaction.savepoint_rollback(sid)
+            del calls[count:]
+            raise
+        transaction.savepoint_commit(sid)
+        return result
+
+    calls = _pending.calls = []
+    try:
+        result = transaction.commit_on_success(func)(*args)
+    finally:
+        del _pending.calls
+
+    for func, args in calls:
+        func(*args)
+
+    return result
+
+def has_savepoints():
+    """Return ``True`` if the database supports savepoints (e.g. not
+    SQLite), such that a nested :func:`atomic` call can be rolled
+    back on its own."""
+
+    return connection.features.uses_savepoints
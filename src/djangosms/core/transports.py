@@ -1,15 +1,27 @@
+from __future__ import absolute_import
+
 import re
 import sys
+import random
 import logging
 
 try:
     import sms
+    from sms import ModemError
 except ImportError: # pragma: NOCOVER
     sms = None
 
+    class ModemError(Exception):
+        pass
+
 from datetime import datetime
+from datetime import timedelta
+from threading import Event
+from threading import Lock
 from threading import Thread
+from threading import Timer
 from time import sleep
+from Queue import Empty
 from urllib import urlencode
 from urllib2 import Request
 from urllib2 import urlopen
@@ -18,6 +30,7 @@ from traceback import format_exc
 from warnings import warn
 from weakref import ref as weakref
 
+from django.db import close_connection
 from django.db.models import signals
 from django.dispatch import Signal
 from django.conf import settings
@@ -25,7 +38,22 @@ from django.conf import settings
 from .models import Incoming
 from .models import Outgoing
 from .models import Connection
+from .models import Outbox
 from .router import route
+from .pool import ConnectionPool
+from .ratelimit import RateLimiter
+from .spool import Spool
+from .transaction import atomic
+from .transaction import defer
+from .delivery import DeliveryBuffer
+from .leader import is_leader
+from .multipart import Reassembler
+from .multipart import concatenation_udh
+from .multipart import parse_udh
+from .scheduler import Scheduler
+from .scheduler import depth
+from .scheduler import select
+from . import pdu
 
 pre_route = Signal()
 post_route = Signal()
@@ -35,6 +63,18 @@ hangup = Signal()
 def shrink(string): # pragma: NOCOVER
     return string.replace('\r', '').replace('\n', '').strip()
 
+def _group_by_text(messages):
+    # groups are returned in order of first appearance
+    groups = {}
+    texts = []
+    for message in messages:
+        group = groups.get(message.text)
+        if group is None:
+            group = groups[message.text] = []
+            texts.append(message.text)
+        group.append(message)
+    return [groups[text] for text in texts]
+
 class Transport(object):
     """Transport.
 
@@ -46,9 +86,24 @@ class Transport(object):
 
     If an implementation needs to operate in a separate thread, this
     should be set up in the class constructor.
+
+    Outgoing messages are subject to rate limiting; set ``RATE`` to
+    limit the number of messages per second (``RATE_BURST`` sets the
+    burst size) and ``RATE_PREFIXES`` to a dictionary which maps
+    destination prefixes to a rate. The ``SEND_RATE`` setting applies
+    to all transports.
+
+    Transports which own a device or poll for work should set the
+    ``exclusive`` class attribute; if the ``TRANSPORT_LOCK`` setting
+    is used, such transports are started only in the process which
+    holds the lock.
     """
 
     router = None
+    exclusive = False
+    rate = None
+    rate_burst = None
+    rate_prefixes = {}
 
     def __init__(self, name, options={}, router=None):
         for key, value in options.items():
@@ -56,6 +111,8 @@ class Transport(object):
 
         self.name = name
         self.router = router or route
+        self.limiter = RateLimiter(
+            self.rate, self.rate_burst, self.rate_prefixes)
 
 class Message(Transport):
     """Message transport.
@@ -64,24 +121,151 @@ class Message(Transport):
 
     When the transport receives an incoming message it should call the
     :meth:`incoming` method for processing.
+
+    :param options: Set ``ATOMIC`` to a true value to store, route and respond to each incoming message in a single database transaction. Messages are then sent only after the transaction has been committed. Fragments of concatenated messages are buffered for up to ``FRAGMENT_TIMEOUT`` seconds (default is ``300``) and then routed on a timer as they are; ``FRAGMENT_LIMIT`` limits the number of buffered fragments (default is ``1000``). Outgoing messages are sent in order of priority class (replies, then notifications, then bulk messages), except that a message which has been pending for ``MAX_WAIT`` seconds (default is ``60``) is promoted by one class.
     """
 
-    def incoming(self, ident, text, time=None, suppress_responses=False):
+    atomic = False
+    fragment_timeout = 300
+    fragment_limit = 1000
+    max_wait = 60.0
+
+    def __init__(self, *args, **kwargs):
+        super(Message, self).__init__(*args, **kwargs)
+
+        self.fragments = Reassembler(
+            self.fragment_timeout, self.fragment_limit)
+        self._expiry = None
+        self._expiry_lock = Lock()
+
+    def incoming(self, ident, text, time=None, suppress_responses=False,
+                 part=None, token=None):
         """Route incoming text message.
 
+        If the message is a fragment of a concatenated message,
+        ``part`` is a tuple ``(reference, total, sequence)``. The
+        fragments are then buffered and routed as a single message
+        when all have arrived (the ``parts`` attribute of the message
+        holds the text of each fragment); until then, the method
+        returns ``None``. Incomplete messages are routed with the
+        fragments that did arrive when they expire. The ``token`` of
+        each fragment (if any) is passed to :meth:`release_fragments`
+        when its message has been routed, or if routing fails.
+
         When the system runs in debug mode (with the ``DEBUG`` setting
         set to a true value), all exceptions are let through to the
         calling method. Otherwise a warning is logged with the full
         traceback while the exception is suppressed.
         """
 
+        try:
+            self.expire_fragments()
+        except:
+            # the fragments of the expired message have been released
+            if settings.DEBUG:
+                raise
+            cls, exc, tb = sys.exc_info()
+            warn("%s ERROR [%s] - Unable to route expired fragments."
+                 "\n\n%s" % (datetime.now().isoformat(),
+                              type(exc).__name__, format_exc(exc)))
+
+        if part is None:
+            return self._route_incoming(
+                ident, text, time, suppress_responses, ())
+
+        result = self.fragments.add(ident, text, time, token=token, *part)
+        if result is None:
+            self._schedule_expiry()
+            return
+
+        text, time, parts, tokens = result
+        return self._route_fragments(
+            ident, text, time, suppress_responses, parts, tokens)
+
+    def depth(self):
+        """Return dictionary which maps each priority class to the
+        number of messages pending for this transport."""
+
+        return depth(Outbox.objects.filter(transport=self.name))
+
+    def expire_fragments(self):
+        """Route incomplete concatenated messages which have
+        expired."""
+
+        for ident, text, time, parts, tokens in self.fragments.expired():
+            self._route_fragments(ident, text, time, False, parts, tokens)
+
+    def release_fragments(self, tokens, routed):
+        """Called with the tokens of the fragments of a concatenated
+        message when it has been routed (``routed`` is true) or when
+        routing failed. The default implementation does nothing."""
+
+    def _route_fragments(self, ident, text, time, suppress_responses,
+                         parts, tokens):
+        try:
+            message = self._route_incoming(
+                ident, text, time, suppress_responses, parts)
+        except:
+            self.release_fragments(tokens, False)
+            raise
+
+        self.release_fragments(tokens, True)
+        return message
+
+    def _schedule_expiry(self):
+        # route incomplete messages when they expire, even if no
+        # further messages arrive
+        deadline = self.fragments.deadline
+        if deadline is None:
+            return
+
+        with self._expiry_lock:
+            if self._expiry is not None:
+                return
+
+            reference = weakref(self)
+
+            def expire():
+                transport = reference()
+                if transport is None:
+                    return
+
+                with transport._expiry_lock:
+                    transport._expiry = None
+
+                try:
+                    transport.expire_fragments()
+                except:
+                    cls, exc, tb = sys.exc_info()
+                    warn("%s ERROR [%s] - Unable to route expired "
+                         "fragments.\n\n%s" % (
+                             datetime.now().isoformat(),
+                             type(exc).__name__, format_exc(exc)))
+                finally:
+                    close_connection()
+
+                transport._schedule_expiry()
+
+            timer = self._expiry = Timer(
+                max(0, deadline - get_time()) + 0.1, expire)
+            timer.setDaemon(True)
+            timer.start()
+
+    def _route_incoming(self, ident, text, time, suppress_responses, parts):
+        if not self.atomic:
+            return self._incoming(
+                ident, text, time, suppress_responses, parts)
+
+        return atomic(self._incoming, ident, text, time,
+                      suppress_responses, parts)
+
+    def _incoming(self, ident, text, time, suppress_responses, parts):
         time = time or datetime.now()
         message = Incoming(text=text, time=time, suppress_responses=suppress_responses)
+        message.parts = parts
 
         # make sure we have a connection record for this sender
-        message.uri = "%s://%s" % (self.name, ident)
-        connection, created = Connection.objects.get_or_create(uri=message.uri)
-        if created: connection.save()
+        message.connection = Connection.from_uri("%s://%s" % (self.name, ident))
 
         # save message
         message.save()
@@ -109,7 +293,7 @@ class GSM(Message): # pragma: NOCOVER
 
     :param name: Transport name
 
-    :param options: ``DEVICE`` is the modem serial port (e.g. ``\"COM1\"``) or special device path (e.g. ``\"/dev/ttyUSB0\"``); ``LOG_LEVEL`` sets the logging level (default is ``\"WARN\"`` which is quiet unless there's an error); ``DCS`` is the data coding scheme (default is ``0`` for normal delivery, ``16`` sends flash messages); ``VALIDITY`` sets the message expiration (use ``167`` for one day); ``STORAGE`` sets the preferred message storage (use ``ME`` for internal, ``SM`` for SIM card or ``MT`` for either); set ``DELIVERY`` to a true value to request delivery reports (may incur an extra charge, use with caution).
+    :param options: ``DEVICE`` is the modem serial port (e.g. ``\"COM1\"``) or special device path (e.g. ``\"/dev/ttyUSB0\"``); ``LOG_LEVEL`` sets the logging level (default is ``\"WARN\"`` which is quiet unless there's an error); ``DCS`` is the data coding scheme (default is ``0`` for normal delivery, ``16`` sends flash messages); ``VALIDITY`` sets the message expiration (use ``167`` for one day); ``STORAGE`` sets the preferred message storage (use ``ME`` for internal, ``SM`` for SIM card or ``MT`` for either); set ``DELIVERY`` to a true value to request delivery reports (may incur an extra charge, use with caution), which are applied in bulk when ``DLR_BUFFER`` reports have been received (default is ``100``) or every ``DLR_INTERVAL`` seconds (default is ``5``); the modem is considered unhealthy after ``MAX_ERRORS`` consecutive send errors (default is ``3``); set ``MODE`` to ``\"pdu\"`` to exchange messages with the modem as protocol data units (the default is ``\"text\"``), which allows concatenated and Unicode messages. The transport reads incoming messages when the modem indicates their arrival and sends outgoing messages as soon as they're created; ``POLL_INTERVAL`` sets how often (in seconds) to check for outgoing messages created by other processes, and for incoming messages if the modem does not support new message indications (default is ``10``); ``SIGNAL_INTERVAL`` sets how often to check the signal strength (default is ``30``). Pending messages are sent ``CLAIM_SIZE`` at a time (default is ``10``) such that messages of a higher priority class are not held up for long.
 
     Example::
 
@@ -122,6 +306,7 @@ class GSM(Message): # pragma: NOCOVER
 
     """
 
+    exclusive = True
     device = None
     dcs = 0
     delivery = None
@@ -129,132 +314,199 @@ class GSM(Message): # pragma: NOCOVER
     log_level = "WARN"
     storage = ""
     timeout = 3
+    max_errors = 3
+    mode = "text"
+    poll_interval = 10
+    signal_interval = 30
+    claim_size = 10
+    idle_interval = 0.25
+    dlr_buffer = 100
+    dlr_interval = 5.0
+    pool = None
+    strength = None
+    errors = 0
+    indications = False
 
     _hangup = False
+    _unread = True
 
     def __init__(self, *args, **kwargs):
         super(GSM, self).__init__(*args, **kwargs)
 
-        # verify availability of sms module
-        if sms is None:
-            raise ImportError('sms')
+        # set when there's outgoing work
+        self._wake = Event()
+
+        # maps message reference to ``(message id, number)`` for
+        # recent sends that requested a status report
+        self.references = {}
+        if self.delivery:
+            self.deliveries = DeliveryBuffer(
+                self.dlr_buffer, self.dlr_interval)
 
         formatter = logging.Formatter("%(asctime)s - %(name)s - "
                                       "%(levelname)s - %(message)s")
         handler = logging.StreamHandler(sys.stderr)
         handler.setFormatter(formatter)
         level = getattr(logging, self.log_level.upper())
-        logger = self.logger = logging.Logger(self.name.upper(), level=level)
+        label = self.name.upper()
+        if self.pool is not None:
+            label = "%s:%s" % (label, self.device)
+        logger = self.logger = logging.Logger(label, level=level)
         logger.addHandler(handler)
 
         try:
-            self.modem = sms.Modem(self.device)
-        except sms.ModemError, error:
+            self.modem = self.connect()
+        except ModemError, error:
             logger.error(error)
         else:
             self.logger.info("Connected to %s..." % self.device)
             if not self.setup():
                 return
 
-            # listen to hangup-signal
-            hangup.connect(self.stop)
+            self.start()
 
-            # start thread
-            thread = Thread(target=self.run)
-            thread.start()
+    def connect(self):
+        """Return modem object for the device; the ``conn``
+        attribute is the serial connection (see
+        :class:`djangosms.core.testing.Modem`)."""
+
+        # verify availability of sms module
+        if sms is None:
+            raise ImportError('sms')
+
+        return sms.Modem(self.device)
+
+    def start(self):
+        """Start transport thread."""
+
+        # listen to hangup-signal
+        hangup.connect(self.stop)
+
+        # wake up when an outgoing message is created (after the
+        # message has been committed)
+        reference = weakref(self)
+        prefix = "%s://" % self.name
+
+        def on_outgoing(sender=None, instance=None, created=False, **kwargs):
+            transport = reference()
+            if transport is not None and created and \
+                   instance.uri is not None and \
+                   instance.uri.startswith(prefix):
+                defer(transport._wake.set)
+
+        signals.post_save.connect(on_outgoing, sender=Outgoing, weak=False)
+
+        thread = Thread(target=self.run)
+        thread.start()
+
+    @property
+    def healthy(self):
+        """Return ``True`` if the modem is connected, has a signal
+        and sends without errors."""
+
+        return getattr(self, 'modem', None) is not None and \
+               not self._hangup and self.strength != -1 and \
+               self.errors < self.max_errors
 
     def run(self):
+        next_signal = next_poll = 0
+
         while not self._hangup:
-            # wait for signal
-            strength = self.check_signal_strength()
-            if strength == -1:
-                self.logger.warn("No signal; waiting 10 seconds.")
+            # recover from send errors
+            if self.errors >= self.max_errors:
+                self.logger.warn("%d send errors; waiting 10 seconds." % \
+                                 self.errors)
                 for i in range(10):
                     sleep(1)
                     if self._hangup:
                         break
+                if self.ping():
+                    self.errors = 0
                 continue
-            elif strength is not None:
-                self.logger.debug("Signal strength: %d." % strength)
 
-            # incoming
-            try:
-                self.modem.wait(1)
-                messages = self.modem.messages()
-            except sms.ModemError, error:
-                self.logger.warn(error)
-                sleep(1)
-                continue
-
-            if len(messages) > 0:
-                self.logger.debug("Received %d message(s)." % len(messages))
+            # check signal strength
+            now = get_time()
+            if now >= next_signal:
+                strength = self.strength = self.check_signal_strength()
+                if strength == -1:
+                    self.logger.warn("No signal; waiting 10 seconds.")
+                    for i in range(10):
+                        sleep(1)
+                        if self._hangup:
+                            break
+                    continue
+                elif strength is not None:
+                    self.logger.debug("Signal strength: %d." % strength)
+                next_signal = now + self.signal_interval
+
+            # check for work left by other processes (or for incoming
+            # messages if the modem doesn't indicate their arrival)
+            if now >= next_poll:
+                next_poll = now + self.poll_interval
+                if not self.indications:
+                    self._unread = True
+                self._wake.set()
+
+            # read unsolicited result codes
+            self.read()
 
-            for message in messages:
-                ignored = ""
-                if len(message.number) < 6:
-                    ignored = " [IGNORED]"
-                self.logger.debug("%s --> %s%s" % (
-                    message.number, repr(
-                        message.text.encode('utf-8')), ignored))
-                if not ignored:
-                    self.incoming(message.number, message.text, message.date)
+            # incoming
+            if self._unread:
+                self._unread = False
+                try:
+                    messages = self.receive()
+                except ModemError, error:
+                    self._unread = True
+                    self.logger.warn(error)
+                    sleep(1)
+                    continue
+
+                if len(messages) > 0:
+                    self.logger.debug("Received %d message(s)." % len(messages))
+
+                for message in messages:
+                    ignored = ""
+                    if len(message.number) < 6:
+                        ignored = " [IGNORED]"
+                    self.logger.debug("%s --> %s%s" % (
+                        message.number, repr(
+                            message.text.encode('utf-8')), ignored))
+                    if not ignored:
+                        self.incoming(message.number, message.text, message.date,
+                                      part=getattr(message, 'part', None))
+
+                # delete all read (and stored sent) messages
+                result = self.query("AT+CMGD=0,2")
+                if 'OK' not in result:
+                    self.logger.critical(
+                        "Error deleting messages (%s)." % shrink(result))
+                    self.stop()
+
+            self.expire_fragments()
 
             # outgoing
-            messages = Outgoing.objects.filter(
-                time=None, connection__uri__startswith="%s://" % self.name,
-                in_response_to__message__suppress_responses=False)
+            if not self._wake.isSet():
+                self._wake.wait(self.idle_interval)
+                continue
+
+            self._wake.clear()
+            if self.pool is not None:
+                messages = self.pool.claim(self)
+            else:
+                messages = [entry.message for entry in select(
+                    Outbox.objects.filter(transport=self.name).select_related(
+                        'message'), self.claim_size, self.max_wait)]
             if len(messages) > 0:
                 self.logger.debug("Sending %d message(s)..." % len(messages))
 
-            for message in messages.all():
-                try:
-                    self.logger.debug("%s <-- %s" % (
-                        message.connection.ident, repr(message.text.encode('utf-8'))))
-
-                    # prepare send
-                    self.modem.conn.write("AT+CMGS=\"%s\"\r" % message.connection.ident)
-                    result = self.modem.conn.readall()
-
-                    if '>' not in result:
-                        self.logger.debug("Sending message failed "
-                                          "before text was sent "
-                                          "(%s)." % shrink(result))
-                        continue
-
-                    # send text
-                    
-                    self.modem.conn.write(message.text + "\x1A")
-                    self.modem.conn.flush()
-
-                    # wait for message id
-                    timeout = get_time() + self.timeout
-                    while 'ERROR' not in result and get_time() < timeout:
-                        result = self.modem.conn.readall()
-                        m = re.search(r'\+CMGS: (\d+)', result)
-                        if m is not None:
-                            message.delivery_id = int(m.group(1))
-                            break
-                    else:
-                        self.logger.debug("Did not receive message id.")
-                        raise sms.ModemError(shrink(result))
-
-                except sms.ModemError, error:
-                    self.logger.warn(error)
-                    sleep(1)
-                else:
-                    self.logger.debug("Message sent with delivery id: %s." % \
-                                      message.delivery_id)
-                    message.time = datetime.now()
-                    message.save()
+                # there may be more work
+                self._wake.set()
 
-            # delete all read (and stored sent) messages
-            self.modem.conn.write("AT+CMGD=0,2\r\n")
-            self.modem.conn.flush()
-            result = self.modem.conn.readall()
-            if 'OK' not in result:
-                self.logger.critical(
-                    "Error deleting messages (%s)." % shrink(result))
-                self.stop()
+            try:
+                self.send_many(messages)
+            finally:
+                if self.pool is not None:
+                    self.pool.release(messages)
 
         try:
             del self.modem
@@ -263,6 +515,169 @@ class GSM(Message): # pragma: NOCOVER
         else:
             self.logger.info("Disconnected.")
 
+    def send_many(self, messages):
+        """Send outgoing messages; stops early if the modem becomes
+        unhealthy."""
+
+        for message in messages:
+            if self.errors >= self.max_errors or self._hangup:
+                break
+
+            try:
+                self.logger.debug("%s <-- %s" % (
+                    message.connection.ident, repr(message.text.encode('utf-8'))))
+
+                # wait for rate limits
+                delay = self.limiter.acquire(message.connection.ident)
+                if delay:
+                    self.logger.debug("Throttled for %.2f seconds "
+                                      "(%.2f seconds in total)." % (
+                                          delay, self.limiter.throttled))
+
+                if self.mode == "pdu":
+                    message.delivery_id = self._submit_pdu(message)
+                else:
+                    message.delivery_id = self._submit_text(message)
+            except ModemError, error:
+                self.logger.warn(error)
+                self.errors += 1
+                sleep(1)
+            except Exception, exc:
+                # the message can't be sent (e.g. it can't be encoded);
+                # this does not indicate a problem with the modem, but
+                # retrying won't help either
+                self.logger.error("Unable to send message %s (%s).\n\n%s" % (
+                    message.id, exc, format_exc(exc)))
+                message.failed = True
+                message.save()
+            else:
+                self.errors = 0
+                self.logger.debug("Message sent with delivery id: %s." % \
+                                  message.delivery_id)
+                message.time = datetime.now()
+                message.save()
+
+                if self.delivery:
+                    self.references[message.delivery_id] = (
+                        message.id, message.connection.ident)
+
+    def receive(self):
+        """Return list of incoming messages (with attributes
+        ``number``, ``text`` and ``date``).
+
+        In PDU mode, messages also have the ``part`` attribute (see
+        :meth:`incoming`) and status reports are passed to
+        :meth:`report`.
+        """
+
+        if self.mode != "pdu":
+            return self.modem.messages()
+
+        result = self.query("AT+CMGL=4")
+        messages = []
+        for data in re.findall(r'\+CMGL: [^\r\n]*\r?\n([0-9A-Fa-f]+)', result):
+            try:
+                message = pdu.decode(data)
+            except Exception, exc:
+                self.logger.warn("Unable to decode %s (%s)." % (data, exc))
+                continue
+
+            if message.type == pdu.DELIVER:
+                messages.append(message)
+            elif message.type == pdu.STATUS_REPORT:
+                self.report(message)
+            else:
+                # e.g. a stored copy of a sent message
+                self.logger.debug("Skipping %s (not an incoming "
+                                  "message)." % data)
+
+        return messages
+
+    def report(self, status):
+        """Handle status report (see
+        :class:`djangosms.core.pdu.PDU`).
+
+        The report is matched to a recent send by the message
+        reference and recipient; confirmed deliveries are applied in
+        bulk.
+        """
+
+        self.logger.debug("Status report for message reference %d: %d." % (
+            status.reference, status.status))
+
+        entry = self.references.get(status.reference)
+        if entry is None or entry[1][-8:] != status.number[-8:]:
+            self.logger.debug("No message for status report.")
+            return
+
+        delivered = status.delivered
+        if delivered is None:
+            return
+
+        del self.references[status.reference]
+        if delivered:
+            self.deliveries.add(status.discharge, message_id=entry[0])
+        else:
+            self.logger.warn("Message %d was not delivered (status %d)." % (
+                entry[0], status.status))
+
+    def _submit_text(self, message):
+        self.modem.conn.write("AT+CMGS=\"%s\"\r" % message.connection.ident)
+        result = self.read()
+
+        if '>' not in result:
+            raise ModemError("Sending message failed before text "
+                             "was sent (%s)." % shrink(result))
+
+        self.modem.conn.write(message.text + "\x1A")
+        self.modem.conn.flush()
+        return self._read_reference(result)
+
+    def _submit_pdu(self, message):
+        # each part of a concatenated message is submitted separately;
+        # the delivery id is the reference of the first part
+        plan = message.plan
+        reference = random.randint(0, 255)
+        delivery_id = None
+
+        for sequence, text in enumerate(plan.parts):
+            udh = ""
+            if plan.segments > 1:
+                udh = concatenation_udh(
+                    reference, plan.segments, sequence + 1)
+
+            data, length = pdu.encode_submit(
+                message.connection.ident, text, plan.encoding, udh,
+                self.dcs, self.validity, bool(self.delivery))
+
+            self.modem.conn.write("AT+CMGS=%d\r" % length)
+            result = self.read()
+
+            if '>' not in result:
+                raise ModemError("Sending message failed before data "
+                                 "was sent (%s)." % shrink(result))
+
+            self.modem.conn.write(data + "\x1A")
+            self.modem.conn.flush()
+
+            message_reference = self._read_reference(result)
+            if delivery_id is None:
+                delivery_id = message_reference
+
+        return delivery_id
+
+    def _read_reference(self, result):
+        # wait for message reference
+        timeout = get_time() + self.timeout
+        while 'ERROR' not in result and get_time() < timeout:
+            result = self.read()
+            m = re.search(r'\+CMGS: (\d+)', result)
+            if m is not None:
+                return int(m.group(1))
+
+        self.logger.debug("Did not receive message id.")
+        raise ModemError(shrink(result))
+
     def check_signal_strength(self):
         """Returns an integer between 1 and 99, representing the
         current signal strength of the GSM network, ``-1`` if we don't
@@ -286,7 +701,36 @@ class GSM(Message): # pragma: NOCOVER
     def query(self, command):
         self.modem.conn.write("%s\r" % command)
         self.modem.conn.flush()
-        return self.modem.conn.readall()
+        return self.read()
+
+    def read(self):
+        """Read from the modem, noting unsolicited result codes."""
+
+        result = self.modem.conn.readall()
+        if '+CMTI:' in result:
+            self._unread = True
+        if '+CDS:' in result:
+            for status in self._parse_status_reports(result):
+                self.report(status)
+        return result
+
+    def _parse_status_reports(self, result):
+        # PDU mode: ``+CDS: <length>`` followed by the PDU on the next
+        # line; text mode: ``+CDS: <fo>,<mr>,<ra>,<tora>,<scts>,<dt>,<st>``
+        for data in re.findall(r'\+CDS: \d+\r?\n([0-9A-Fa-f]+)', result):
+            try:
+                yield pdu.decode(data)
+            except Exception, exc:
+                self.logger.warn("Unable to decode %s (%s)." % (data, exc))
+
+        for m in re.finditer(r'\+CDS: \d+,(\d+),"([^"]*)",\d*,'
+                             r'"([^"]+)","([^"]+)",(\d+)', result):
+            reference, number, date, discharge, status = m.groups()
+            yield pdu.PDU(pdu.STATUS_REPORT, reference=int(reference),
+                          number=number, status=int(status),
+                          date=datetime.strptime(date[:17], "%y/%m/%d,%H:%M:%S"),
+                          discharge=datetime.strptime(
+                              discharge[:17], "%y/%m/%d,%H:%M:%S"))
 
     def setup(self):
         while not self.ping():
@@ -307,14 +751,15 @@ class GSM(Message): # pragma: NOCOVER
                                  "storage to %s." % self.storage)
 
         # query mode availability
+        mode = self.mode == "pdu" and "0" or "1"
         result = self.query("AT+CMGF=?")
-        if '1' not in result:
-            self.logger.critical("Modem does not support text mode (%s)." % \
-                                 shrink(result))
+        if mode not in result:
+            self.logger.critical("Modem does not support %s mode (%s)." % (
+                self.mode, shrink(result)))
             return
 
-        # set text mode
-        result = self.query("AT+CMGF=1")
+        # set message mode
+        result = self.query("AT+CMGF=%s" % mode)
         if 'OK' not in result:
             self.logger.critical("Unable to set message mode (%s)." % \
                                  shrink(result))
@@ -327,6 +772,17 @@ class GSM(Message): # pragma: NOCOVER
                                  "messages (%s)." % shrink(result))
             return
 
+        # enable new message indications (and status reports)
+        result = self.query("AT+CNMI=2,1,0,%d,0" % (self.delivery and 1 or 0))
+        self.indications = 'OK' in result
+        if not self.indications:
+            self.logger.warn("Modem does not indicate new messages; "
+                             "polling every %s seconds." % self.poll_interval)
+
+        # in PDU mode, these options are part of each message
+        if self.mode == "pdu":
+            return True
+
         options = 1
         if self.validity:
             options |= 16
@@ -351,15 +807,105 @@ class GSM(Message): # pragma: NOCOVER
         self.logger.info("Stopping...")
         self._hangup = True
 
+        if self.delivery:
+            self.deliveries.stop()
+
     def ussd(self, request):
         """Place USSD request."""
 
         self.logger.info("Requesting %s..." % request)
         self.modem.conn.write("AT+CUSD=1,\"%s\",15\r" % request)
         self.modem.conn.flush()
-        result = self.modem.conn.readall()
+        result = self.read()
         self.logger.info(shrink(result))
 
+class GSMPool(Message):
+    """Pool of GSM modems which share a transport name.
+
+    Each device is operated by a :class:`GSM` transport in its own
+    thread; incoming messages from all modems are handled as if they
+    arrived on a single transport. Outgoing messages are handed out
+    to modems as they become available, in proportion to the signal
+    strength of each modem. Unhealthy modems (no signal, too many
+    send errors or disconnected) are taken out of rotation until they
+    recover.
+
+    :param name: Transport name
+
+    :param options: ``DEVICES`` is a sequence of serial ports or device paths; ``CLAIM_SIZE`` limits the number of messages handed to a modem at a time (default is ``10``). All other options are passed on to each :class:`GSM` transport.
+
+    Example::
+
+      TRANSPORTS = {
+          'gsm': {
+              'TRANSPORT': 'router.transports.GSMPool',
+              'DEVICES': ('/dev/ttyUSB0', '/dev/ttyUSB1'),
+          }
+      }
+
+    """
+
+    exclusive = True
+    devices = ()
+    claim_size = 10
+    member = GSM
+
+    def __init__(self, name, options={}, router=None):
+        super(GSMPool, self).__init__(name, options, router)
+
+        self._lock = Lock()
+        self._claimed = set()
+
+        options = dict((key, value) for (key, value) in options.items()
+                       if key.lower() not in ('devices', 'claim_size'))
+
+        self.members = []
+        for device in self.devices:
+            self.members.append(self.member(
+                name, dict(options, device=device, pool=self), router))
+
+    @staticmethod
+    def weight(member):
+        # modems which can't report signal strength count as average
+        strength = member.strength
+        if strength is None:
+            strength = 15
+        return strength + 1
+
+    def claim(self, member):
+        """Return list of outgoing messages for ``member`` to send.
+
+        Messages are claimed until :meth:`release` is called.
+        """
+
+        with self._lock:
+            healthy = [m for m in self.members if m.healthy]
+            if member not in healthy:
+                return []
+
+            query = Outbox.objects.filter(transport=self.name)
+            limit = len(self._claimed) + self.claim_size * len(healthy)
+            pending = [entry.pk for entry in select(
+                query, limit, self.max_wait) if entry.pk not in self._claimed]
+            if not pending:
+                return []
+
+            # the modem's share of pending messages (rounded up)
+            total = sum(map(self.weight, healthy))
+            share = -(-len(pending) * self.weight(member) // total)
+            pending = pending[:min(share, self.claim_size)]
+            self._claimed.update(pending)
+
+        messages = Outgoing.objects.in_bulk(pending)
+        return [messages[pk] for pk in pending if pk in messages]
+
+    def release(self, messages):
+        """Release claimed messages (sent or not)."""
+
+        with self._lock:
+            self._claimed.difference_update(
+                message.pk for message in messages)
+
 class HTTP(Message):
     """Generic HTTP transport.
 
@@ -372,7 +918,7 @@ class HTTP(Message):
 
     :param name: Transport name
 
-    :param options: Dictionary; define ``'SEND_URL'`` for the (outgoing) service and ``'DLR_URL'`` to set the (incoming) delivery confirmation reply
+    :param options: Dictionary; define ``'SEND_URL'`` for the (outgoing) service and ``'DLR_URL'`` to set the (incoming) delivery confirmation reply; set ``'SENDERS'`` to a positive number to send messages from a queue using this number of threads (``'QUEUE_SIZE'`` limits the number of queued messages; when the queue is full, saving an outgoing message blocks until there's room); set ``'POOL_SIZE'`` to a positive number to reuse up to this number of persistent connections to the service (idle connections are closed after ``'POOL_TIMEOUT'`` seconds); set ``'BATCH_SIZE'`` to submit queued messages with identical text to up to this number of recipients in a single request (requires ``'SENDERS'``); set ``'MAX_ATTEMPTS'`` to retry failed sends up to this total number of attempts, with an exponential backoff starting at ``'RETRY_DELAY'`` seconds and limited to ``'RETRY_MAX_DELAY'`` seconds (messages are marked as failed when no attempts remain); set ``'SPOOL'`` to a directory path to accept incoming messages into a durable queue in this directory, responding immediately, while ``'WORKERS'`` threads (default is one) route queued messages (the ``depth`` and ``lag`` attributes of the ``spool`` object report the number of queued messages and the age of the oldest); set ``'DLR_BUFFER'`` to apply delivery confirmations in bulk when this number has been received or every ``'DLR_INTERVAL'`` seconds, and ``'DLR_SPOOL'`` to a directory path to journal buffered confirmations so they survive a crash
 
     Example 1: Kannel
 
@@ -411,12 +957,164 @@ class HTTP(Message):
     send_url = None
     dlr_url = None
     timeout = 30.0
+    senders = 0
+    queue_size = 1000
+    queue = None
+    pool_size = 0
+    pool_timeout = 60.0
+    pool = None
+    batch_size = 1
+    max_attempts = 1
+    retry_delay = 60
+    retry_max_delay = 3600
+    retry_interval = 10
+    spool = None
+    workers = 1
+    dlr_buffer = 0
+    dlr_interval = 5.0
+    dlr_spool = None
+
+    _hangup = False
+    _workers = ()
 
     def __init__(self, *args, **kwargs):
         super(HTTP, self).__init__(*args, **kwargs)
 
         reference = weakref(self)
 
+        # delivery confirmations
+        self.deliveries = DeliveryBuffer(
+            self.dlr_buffer, self.dlr_interval,
+            self.dlr_spool and Spool(self.dlr_spool) or None)
+        if self.dlr_buffer:
+            hangup.connect(self.stop)
+
+        # start routing workers
+        if self.spool is not None:
+            self.spool = Spool(self.spool)
+            event = self._spooled = Event()
+
+            def worker():
+                try:
+                    while True:
+                        transport = reference()
+                        if transport is None or transport._hangup:
+                            break
+                        try:
+                            routed = transport.route_spooled(100)
+                        except:
+                            routed = 0
+                            cls, exc, tb = sys.exc_info()
+                            warn("%s ERROR [%s] - Unable to route queued "
+                                 "messages.\n\n%s" % (
+                                     datetime.now().isoformat(),
+                                     type(exc).__name__, format_exc(exc)))
+                        del transport
+                        if not routed:
+                            event.wait(1.0)
+                            event.clear()
+                finally:
+                    close_connection()
+
+            self._workers = []
+            for i in range(self.workers):
+                thread = Thread(target=worker)
+                thread.setDaemon(True)
+                thread.start()
+                self._workers.append(thread)
+
+            del worker
+
+            hangup.connect(self.stop)
+
+        # start retry scheduler
+        if self.max_attempts > 1:
+            interval = self.retry_interval
+
+            def scheduler():
+                try:
+                    while True:
+                        sleep(interval)
+                        transport = reference()
+                        if transport is None or transport._hangup:
+                            break
+                        if not is_leader():
+                            del transport
+                            continue
+                        try:
+                            transport.retry_due()
+                        except:
+                            cls, exc, tb = sys.exc_info()
+                            warn("%s ERROR [%s] - Unable to retry "
+                                 "messages.\n\n%s" % (
+                                     datetime.now().isoformat(),
+                                     type(exc).__name__, format_exc(exc)))
+                        del transport
+                finally:
+                    close_connection()
+
+            thread = Thread(target=scheduler)
+            thread.setDaemon(True)
+            thread.start()
+            del scheduler
+
+            hangup.connect(self.stop)
+
+        if self.pool_size:
+            self.pool = ConnectionPool(self.pool_size, self.pool_timeout)
+
+        # start sender threads
+        if self.senders:
+            queue = self.queue = Scheduler(self.queue_size, self.max_wait)
+
+            def sender():
+                try:
+                    while True:
+                        message = queue.get()
+                        transport = reference()
+                        if message is None or transport is None:
+                            break
+
+                        # coalesce queued messages into batches
+                        messages = [message]
+                        while len(messages) < transport.batch_size:
+                            try:
+                                message = queue.get_nowait()
+                            except Empty:
+                                break
+                            if message is None:
+                                queue.put(None)
+                                break
+                            messages.append(message)
+
+                        for batch in _group_by_text(messages):
+                            try:
+                                transport.send_many(batch)
+                            except:
+                                cls, exc, tb = sys.exc_info()
+                                warn("%s ERROR [%s] - Unable to send "
+                                     "message(s) %s.\n\n%s" % (
+                                         datetime.now().isoformat(),
+                                         type(exc).__name__, ", ".join(
+                                             str(message.id)
+                                             for message in batch),
+                                         format_exc(exc)))
+                        del transport
+                finally:
+                    close_connection()
+
+            self._senders = []
+            for i in range(self.senders):
+                thread = Thread(target=sender)
+                thread.setDaemon(True)
+                thread.start()
+                self._senders.append(thread)
+
+            del sender
+
+            # drain queue on hangup
+            hangup.connect(self.stop)
+
         # set up event handler for incoming messages
         def on_incoming(sender=None, name=None, request=None, response=None, **kwargs):
             transport = reference()
@@ -440,13 +1138,13 @@ class HTTP(Message):
                     else:
                         if suppress:
                             return
-                    
-                    transport.send(instance)
+
+                    defer(transport.submit, instance)
 
         signals.post_save.connect(on_outgoing, sender=Outgoing, weak=False)
         del on_outgoing
 
-    def fetch(self, request, **kwargs): # pragma: NOCOVER
+    def fetch(self, request, **kwargs):
         """Fetch HTTP request.
 
         Used internally by the HTTP transport.
@@ -456,6 +1154,11 @@ class HTTP(Message):
         server (replace with a mock implementation).
         """
 
+        if self.pool is not None:
+            status, body = self.pool.request(
+                request.get_full_url(), headers=request.headers, **kwargs)
+            return status // 100 == 2
+
         response = urlopen(request, **kwargs)
         return response.getcode() // 100 == 2
 
@@ -475,23 +1178,39 @@ class HTTP(Message):
 
         :param sender: Mobile number
         :param text: Message body
+        :param udh: User data header (hexadecimal, optional); fragments of concatenated messages are reassembled before routing
 
         Delivery confirmation (DLR):
 
         :param status: Positive integer value means this is a delivery confirmation
         :param id: Message id
+
+        Delivery confirmation for a batch submission (DLR):
+
+        :param status: Positive integer value means this is a delivery confirmation
+        :param batch: Batch id
+        :param to: Mobile number of the recipient
         """
 
+        batch = None
+        udh = part = None
+
         try:
             status = int(request.GET.get('status', 0))
-            time = datetime.fromtimestamp(
-                float(request.GET['timestamp']))
+            timestamp = float(request.GET['timestamp'])
+            time = datetime.fromtimestamp(timestamp)
 
-            if status:
+            if status and 'batch' in request.GET:
+                batch = int(request.GET['batch'])
+                uri = "%s://%s" % (self.name, request.GET['to'])
+            elif status:
                 message_id = int(request.GET['id'])
             else:
                 sender = request.GET['from']
                 text = request.GET['text']
+                if request.GET.get('udh'):
+                    udh = str(request.GET['udh'])
+                    part = parse_udh(udh.decode('hex'))
         except Exception, exc:
             return "There was an error (``%s``) processing the request: %s." % (
                 type(exc).__name__, str(exc)), "406 Not Acceptable"
@@ -500,15 +1219,230 @@ class HTTP(Message):
         # Non-Delivered to Phone, 4: Queued on SMSC, 8: Delivered to
         # SMSC, 16: Non-Delivered to SMSC; since we use the bitmask 3,
         # we can simply check for success or failure
-        if status == 1:
-            message = Outgoing.objects.get(pk=message_id)
-            message.delivery = time
-            message.save()
-        else:
-            self.incoming(sender, text, time)
+        if status == 1 and batch is not None:
+            self.deliveries.add(time, batch=batch, uri=uri)
+        elif status == 1:
+            self.deliveries.add(time, message_id=message_id)
+        elif not status and self.spool is not None:
+            record = {
+                'from': sender,
+                'text': text,
+                'timestamp': timestamp,
+                }
+            if udh is not None:
+                record['udh'] = udh
+            self.spool.put(record)
+            self._spooled.set()
+        elif not status:
+            self.incoming(sender, text, time, part=part)
 
         return "", "200 OK"
 
+    def route_spooled(self, limit=None):
+        """Route messages from the spool; returns the number of
+        messages routed."""
+
+        routed = 0
+        while limit is None or routed < limit:
+            entry = self.spool.claim()
+            if entry is None:
+                break
+
+            key, record = entry
+            udh = record.get('udh')
+            part = udh and parse_udh(udh.decode('hex')) or None
+            try:
+                self.incoming(
+                    record['from'], record['text'],
+                    datetime.fromtimestamp(record['timestamp']),
+                    part=part, token=key)
+            except:
+                # the message was not stored (e.g. the database is
+                # unavailable); it's routed again later
+                if part is None:
+                    self.spool.release(key)
+                raise
+
+            # the record of a fragment is kept until its message has
+            # been routed (see :meth:`release_fragments`)
+            if part is None:
+                self.spool.done(key)
+
+            routed += 1
+
+        return routed
+
+    def release_fragments(self, tokens, routed):
+        # the tokens are the keys of spool records
+        for key in tokens:
+            if routed:
+                self.spool.done(key)
+            else:
+                self.spool.release(key)
+
+    def submit(self, message):
+        """Queue message for sending, or send it immediately if the
+        transport has no sender threads."""
+
+        queue = self.queue
+        if queue is None:
+            self.send(message)
+        else:
+            queue.put(message)
+
+    def depth(self):
+        """Return dictionary which maps each priority class to the
+        number of messages pending for this transport (or queued for
+        the sender threads, if used)."""
+
+        queue = self.queue
+        if queue is None:
+            return super(HTTP, self).depth()
+        return queue.depth
+
+    def stop(self, *args, **kwargs):
+        """Stop sender threads when all queued messages have been
+        sent."""
+
+        self._hangup = True
+        self.deliveries.stop()
+
+        if self._workers:
+            self._spooled.set()
+            for thread in self._workers:
+                thread.join()
+
+        queue, self.queue = self.queue, None
+        if queue is None:
+            return
+
+        for thread in self._senders:
+            queue.put(None)
+        for thread in self._senders:
+            thread.join()
+
+    def send_many(self, messages):
+        """Send messages with identical text in a single request.
+
+        The recipients are listed in the ``to`` parameter, separated
+        by space. All messages in the batch are recorded with the
+        delivery id of the first message; delivery confirmations
+        identify the batch and the recipient.
+        """
+
+        if not messages:
+            return
+
+        if len(messages) == 1:
+            return self.send(messages[0])
+
+        url = self.send_url
+        if url is None: # PRAGMA: nocover
+            raise ValueError("Must set ``SEND_URL`` parameter for "
+                             "transport: %s." % self.name)
+
+        if '?' not in url:
+            url += "?"
+
+        batch = messages[0].id
+        query = self._encode(messages[0])
+        query['to'] = " ".join(
+            message.connection.ident for message in messages)
+
+        if self.dlr_url is not None:
+            query.update({
+                'dlr-url': '%s?status=%%d&batch=%d&to=%%p&timestamp=%%T' % (
+                    self.dlr_url, batch),
+                'dlr-mask': '3'
+                })
+
+        request = Request(
+            url+'&'+urlencode(query)
+            )
+
+        self.limiter.acquire(
+            *[message.connection.ident for message in messages])
+
+        if self._fetch(request, messages):
+            time = datetime.now()
+            pks = [message.id for message in messages]
+            Outgoing.objects.filter(pk__in=pks).update(
+                time=time, delivery_id=batch, next_attempt=None)
+            Outbox.objects.filter(message__in=pks).delete()
+            for message in messages:
+                message.time = time
+                message.delivery_id = batch
+                message.next_attempt = None
+
+    def retry_due(self, now=None):
+        """Resubmit messages that are due for another send attempt.
+
+        The next attempt time of each message is moved ahead by the
+        retry delay (so the message is retried again should this
+        attempt never complete).
+        """
+
+        now = now or datetime.now()
+        lease = now + timedelta(seconds=self.retry_delay)
+
+        messages = list(Outgoing.objects.filter(
+            next_attempt__lte=now, time=None, failed=False,
+            connection__uri__startswith="%s://" % self.name))
+
+        Outgoing.objects.filter(
+            pk__in=[message.id for message in messages]).update(
+            next_attempt=lease)
+
+        for message in messages:
+            message.next_attempt = lease
+            self.submit(message)
+
+        return len(messages)
+
+    def reschedule(self, messages):
+        """Record a failed send attempt for each message.
+
+        The next attempt is scheduled using an exponential backoff
+        with random jitter; when no attempts remain, the message is
+        marked as failed.
+        """
+
+        now = datetime.now()
+        for message in messages:
+            message.attempts += 1
+            if message.attempts >= self.max_attempts:
+                message.failed = True
+                message.next_attempt = None
+            else:
+                delay = min(self.retry_max_delay,
+                            self.retry_delay * 2 ** (message.attempts - 1))
+                message.next_attempt = now + timedelta(
+                    seconds=random.uniform(delay / 2.0, delay))
+            message.save()
+
+    def _encode(self, message):
+        # the text is submitted as UTF-8; messages which can't be
+        # sent using the GSM alphabet are coded as UCS-2
+        query = {'text': message.text.encode('utf-8')}
+        if message.plan.encoding == 'ucs2':
+            query.update({
+                'coding': '2',
+                'charset': 'UTF-8',
+                })
+        return query
+
+    def _fetch(self, request, messages):
+        try:
+            sent = self.fetch(request, timeout=self.timeout)
+        except:
+            self.reschedule(messages)
+            raise
+
+        if not sent:
+            self.reschedule(messages)
+
+        return sent
+
     def send(self, message):
         url = self.send_url
         if url is None: # PRAGMA: nocover
@@ -518,10 +1452,8 @@ class HTTP(Message):
         if '?' not in url:
             url += "?"
 
-        query = {
-            'to': message.connection.ident,
-            'text': message.text,
-            }
+        query = self._encode(message)
+        query['to'] = message.connection.ident
 
         if self.dlr_url is not None:
             query.update({
@@ -534,6 +1466,9 @@ class HTTP(Message):
             url+'&'+urlencode(query)
             )
 
-        if self.fetch(request, timeout=self.timeout):
+        self.limiter.acquire(message.connection.ident)
+
+        if self._fetch(request, (message,)):
             message.time = datetime.now()
+            message.next_attempt = None
             message.save()
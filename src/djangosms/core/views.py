@@ -1,10 +1,13 @@
 from datetime import datetime
 
 from django.http import HttpResponse as Response
+from django.utils import simplejson
 from .transports import http_event
 
 from django.contrib.auth import authenticate
 from djangosms.core.transports import Message
+from djangosms.core.transaction import atomic
+from djangosms.core.transaction import has_savepoints
 
 def incoming(request, name="http+sms"):
     """Incoming messages view.
@@ -42,3 +45,56 @@ def loadmsg(request):
     transport = Message('http+sms')
     transport.incoming(sender, text, timestamp, True)
     return Response()
+
+def loadmsgs(request):
+    """Bulk incoming messages view.
+
+    Accepts the ``username`` and ``password`` parameters like
+    :func:`loadmsg`, but the messages are provided in the
+    ``messages`` parameter as a JSON-encoded list of objects with the
+    keys ``\"from\"``, ``\"text\"`` and ``\"timestamp\"``.
+
+    The user is authenticated once and all messages are handled in a
+    single transaction; a message which fails is rolled back on its
+    own (if the database does not support savepoints, each message is
+    handled in a transaction of its own instead). The response is a
+    JSON-encoded list with a result for each message; either ``{\"id\": <message id>}`` or
+    ``{\"error\": <error string>}``.
+    """
+
+    user = request.POST['username']
+    passwd = request.POST['password']
+    user = authenticate(username=user, password=passwd)
+    if user is None:
+        return Response(status=401)
+
+    try:
+        records = simplejson.loads(request.POST['messages'])
+    except (KeyError, ValueError), exc:
+        return Response(
+            "There was an error (``%s``) processing the request: %s." % (
+                type(exc).__name__, str(exc)), status=400)
+
+    if has_savepoints():
+        results = atomic(_load_messages, records)
+    else:
+        results = _load_messages(records)
+
+    return Response(simplejson.dumps(results), mimetype="application/json")
+
+def _load_messages(records):
+    transport = Message('http+sms')
+    results = []
+    for record in records:
+        try:
+            message = atomic(_load_message, transport, record)
+        except Exception, exc:
+            results.append({'error': "%s: %s" % (type(exc).__name__, exc)})
+        else:
+            results.append({'id': message.id})
+    return results
+
+def _load_message(transport, record):
+    timestamp = datetime.fromtimestamp(float(record['timestamp']))
+    return transport.incoming(
+        record['from'], record['text'], timestamp, True)
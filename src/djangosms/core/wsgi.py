@@ -1,6 +1,7 @@
 import imp
 import signal
 import functools
+from threading import Thread
 from django import conf
 from django import utils
 from django.core.exceptions import ImproperlyConfigured
@@ -35,8 +36,20 @@ def make_app(config, settings=None): # pragma: NOCOVER
 
     return app
 
+def start_transports(transports):
+    for name, factory, options in transports:
+        _transports[name] = factory(name, options)
+
 def make_app_from_settings(settings):
+    # elect a leader process which owns exclusive transports
+    lock = None
+    path = getattr(settings, "TRANSPORT_LOCK", None)
+    if path is not None:
+        from .leader import elect
+        lock = elect(path)
+
     # start transports
+    standby = []
     for name, options in getattr(settings, "TRANSPORTS", {}).items():
         try:
             path = options.pop("TRANSPORT")
@@ -48,7 +61,32 @@ def make_app_from_settings(settings):
         module_name, class_name = path.rsplit('.', 1)
         module = import_module(module_name)
         factory = getattr(module, class_name)
-        _transports[name] = factory(name, options)
+
+        if lock is not None and not lock.held and \
+               getattr(factory, "exclusive", False):
+            standby.append((name, factory, options))
+        else:
+            start_transports(((name, factory, options),))
+
+    # take over exclusive transports if the leader goes away
+    if standby:
+        def take_over():
+            lock.acquire(blocking=True)
+            start_transports(standby)
+
+        thread = Thread(target=take_over)
+        thread.setDaemon(True)
+        thread.start()
+
+    # make sure there's a route record for each handler
+    if getattr(settings, "CREATE_ROUTES", False):
+        from .router import create_routes
+        create_routes(getattr(settings, "ROUTES", ()))
+
+    # run broadcast jobs, including those left by a previous process
+    if "djangosms.reporter" in getattr(settings, "INSTALLED_APPS", ()):
+        from djangosms.reporter import broadcast
+        broadcast.start()
 
     # create handler
     return WSGIHandler()
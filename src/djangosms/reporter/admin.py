@@ -4,3 +4,4 @@ from . import models
 admin.site.register(models.Role)
 admin.site.register(models.Reporter)
 
+admin.site.register(models.Broadcast)
@@ -0,0 +1,191 @@
+"""Background broadcast jobs.
+
+A :class:`~djangosms.reporter.models.Broadcast` is created by the
+reporters view and sent by a worker thread, such that a message to
+thousands of reporters does not hold up the web request. Jobs are
+claimed with a conditional update, so any number of processes may
+run a worker (see :func:`start`).
+
+A job which has made no progress for ``BROADCAST_TIMEOUT`` seconds
+(default is ``600``) is considered abandoned, e.g. because the
+process running it was stopped; it's claimed again and resumed with
+the recipients which have not been sent the message.
+
+The ``BROADCAST_INTERVAL`` setting sets how often (in seconds) the
+worker checks for jobs created by other processes (default is
+``60``); ``BROADCAST_BATCH_SIZE`` sets the number of messages which
+are saved in a single transaction (default is ``100``).
+"""
+
+import sys
+
+from datetime import datetime
+from datetime import timedelta
+from threading import Event
+from threading import Lock
+from threading import Thread
+from traceback import format_exc
+from warnings import warn
+
+from django.conf import settings
+from django.db import close_connection
+from django.db.models import Q
+
+from djangosms.core.models import BULK
+from djangosms.core.models import Connection
+from djangosms.core.models import Outgoing
+from djangosms.core.models import Request
+from djangosms.core.models import latest_connections
+from djangosms.core.transaction import atomic
+
+from .models import Broadcast
+
+_lock = Lock()
+_wake = Event()
+_worker = None
+
+class ClaimLost(Exception):
+    """Raised when a job has been claimed by another worker."""
+
+def resolve(reporters):
+    """Return list of the most recently used connection of each of
+    ``reporters`` (a query).
+
+    The connection is read from the ``last_uri`` column; reporters
+    for which it's not known (see the ``backfillusers`` command) are
+    resolved with one additional query.
+    """
+
+    recent = dict(reporters.values_list('pk', 'last_uri'))
+    if None in recent.values():
+        for user, (uri, latest) in latest_connections(
+            reporters.filter(last_uri=None)).items():
+            recent[user] = uri
+
+    return [Connection(uri=uri, user_id=user) for (user, uri)
+            in sorted(recent.items()) if uri is not None]
+
+def run(job):
+    """Send message to the recipients of ``job``.
+
+    Messages are saved in batches, each in a single transaction;
+    the ``sent`` count of the job is updated after each batch. If the
+    job was started before, recipients which have been sent the
+    message are skipped.
+
+    Raises :class:`ClaimLost` if the job has been claimed by another
+    worker in the meantime; the current batch is then rolled back.
+    """
+
+    batch_size = getattr(settings, 'BROADCAST_BATCH_SIZE', 100)
+
+    connections = resolve(job.reporters)
+    total = len(connections)
+
+    if job.request is None:
+        job.request = Request.objects.create(text=job.text)
+    else:
+        sent = set(Outgoing.objects.filter(
+            in_response_to=job.request).values_list('uri', flat=True))
+        connections = [connection for connection in connections
+                       if connection.uri not in sent]
+
+    _update(job, total=total, request=job.request)
+
+    for i in range(0, len(connections), batch_size):
+        atomic(_send, job, connections[i:i + batch_size])
+
+    _update(job, finished=datetime.now())
+
+def run_pending():
+    """Run jobs which have not been started (or which have been
+    abandoned); returns the number of jobs run."""
+
+    timeout = getattr(settings, 'BROADCAST_TIMEOUT', 600)
+    deadline = _now() - timedelta(seconds=timeout)
+
+    count = 0
+    for job in Broadcast.objects.filter(finished=None).filter(
+        Q(started=None) | Q(updated__lt=deadline)).order_by('created'):
+        # claim job; it may have been claimed by another worker
+        now = _now()
+        if not Broadcast.objects.filter(
+            pk=job.pk, updated=job.updated, finished=None).update(
+            started=job.started or now, updated=now):
+            continue
+
+        job.started = job.started or now
+        job.updated = now
+        try:
+            run(job)
+        except ClaimLost:
+            continue
+        except:
+            cls, exc, tb = sys.exc_info()
+            warn("%s ERROR [%s] - Unable to broadcast message %s.\n\n%s" % (
+                datetime.now().isoformat(), type(exc).__name__,
+                repr(job.text.encode('utf-8')), format_exc(exc)))
+            Broadcast.objects.filter(pk=job.pk, updated=job.updated).update(
+                failed=True, finished=datetime.now())
+
+        count += 1
+
+    return count
+
+def start():
+    """Start the worker thread, which runs pending jobs right away
+    (including jobs left by a process which has stopped)."""
+
+    notify()
+
+def notify():
+    """Wake up the worker thread (starting it if required)."""
+
+    global _worker
+
+    with _lock:
+        if _worker is None:
+            _worker = Thread(target=_work)
+            _worker.setDaemon(True)
+            _worker.start()
+
+    _wake.set()
+
+def _now():
+    # some databases do not store microseconds; the time of the last
+    # update must compare equal when read back
+    return datetime.now().replace(microsecond=0)
+
+def _send(job, connections):
+    for connection in connections:
+        job.request.respond(connection, job.text, BULK)
+
+    _update(job, sent=job.sent + len(connections))
+
+def _update(job, **fields):
+    # update job if it's still claimed by this worker (the previous
+    # update time is unchanged)
+    fields['updated'] = _now()
+    if not Broadcast.objects.filter(
+        pk=job.pk, updated=job.updated).update(**fields):
+        raise ClaimLost(job.pk)
+
+    for name, value in fields.items():
+        setattr(job, name, value)
+
+def _work():
+    interval = getattr(settings, 'BROADCAST_INTERVAL', 60)
+
+    try:
+        while True:
+            _wake.wait(interval)
+            _wake.clear()
+            try:
+                run_pending()
+            except:
+                cls, exc, tb = sys.exc_info()
+                warn("%s ERROR [%s] - Unable to run broadcast jobs.\n\n%s" % (
+                    datetime.now().isoformat(), type(exc).__name__,
+                    format_exc(exc)))
+    finally:
+        close_connection()
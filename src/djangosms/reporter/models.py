@@ -1,9 +1,12 @@
+from datetime import datetime
+
 from django.db import models
 from django.db.models import Q
 from django.db.models import signals
 
 from djangosms.core.models import User
 from djangosms.core.models import Connection
+from djangosms.core.models import Request
 from djangosms.stats.models import Group
 from djangosms.stats.models import Report
 
@@ -78,3 +81,55 @@ class Reporter(User):
 
     def __unicode__(self):
         return self.name
+
+class Broadcast(models.Model):
+    """A message to a set of reporters, sent in the background (see
+    :mod:`djangosms.reporter.broadcast`).
+
+    The recipients are the reporters listed in ``selection``
+    (comma-separated primary keys) or, if empty, all active reporters
+    which match ``search`` (see :func:`query_reporters`).
+
+    The ``updated`` time is set when the job is claimed by a worker
+    and after each batch of messages is sent.
+    """
+
+    text = models.CharField(max_length=160*3)
+    search = models.CharField(max_length=255, blank=True)
+    selection = models.TextField(blank=True)
+    request = models.ForeignKey(Request, null=True)
+    created = models.DateTimeField(default=datetime.now)
+    started = models.DateTimeField(null=True)
+    updated = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    total = models.IntegerField(null=True)
+    sent = models.IntegerField(default=0)
+    failed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __unicode__(self):
+        return self.text
+
+    @property
+    def progress(self):
+        """Return the percentage of recipients which have been sent
+        the message, or ``None`` if not known yet."""
+
+        if not self.total:
+            return self.finished is not None and 100 or None
+        return 100 * self.sent // self.total
+
+    @property
+    def reporters(self):
+        """Return query for the recipients."""
+
+        if self.selection:
+            pks = [int(pk) for pk in self.selection.split(',')]
+            return Reporter.objects.filter(pk__in=pks)
+
+        query = Reporter.objects
+        if self.search:
+            query = query_reporters(self.search)
+        return query.filter(active=True)
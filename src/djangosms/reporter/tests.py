@@ -0,0 +1,129 @@
+from django.test import TestCase
+
+class BroadcastTest(TestCase):
+    def _reporters(self):
+        from datetime import datetime
+        from djangosms.core.models import Connection
+        from djangosms.core.models import Incoming
+        from djangosms.reporter.models import Reporter
+
+        bob = Reporter.from_uri("test://1", name="Bob")
+        jim = Reporter.from_uri("test://2", name="Jim")
+        Reporter.from_uri("test://3", name="Ann", active=False)
+
+        # bob has since used another connection
+        connection = Connection.from_uri("test://4")
+        connection.user = bob
+        connection.save()
+        Incoming.from_uri("test://4", text="test", time=datetime.now())
+
+        # jim has not sent messages; the last connection is used
+        connection = Connection.from_uri("test://5")
+        connection.user = jim
+        connection.save()
+
+        return bob, jim
+
+    def test_resolve(self):
+        from djangosms.core.models import User
+        from djangosms.reporter.broadcast import resolve
+        from djangosms.reporter.models import Reporter
+        bob, jim = self._reporters()
+        connections = resolve(Reporter.objects.filter(active=True))
+        self.assertEqual(
+            [(connection.uri, connection.user_id)
+             for connection in connections],
+            [("test://4", bob.pk), ("test://5", jim.pk)])
+
+        # activity which was not recorded is looked up
+        User.objects.filter(pk__in=(bob.pk, jim.pk)).update(last_uri=None)
+        connections = resolve(Reporter.objects.filter(active=True))
+        self.assertEqual(
+            [(connection.uri, connection.user_id)
+             for connection in connections],
+            [("test://4", bob.pk), ("test://5", jim.pk)])
+
+    def test_run_pending(self):
+        from djangosms.core.models import BULK
+        from djangosms.core.models import Outgoing
+        from djangosms.reporter.broadcast import run_pending
+        from djangosms.reporter.models import Broadcast
+        bob, jim = self._reporters()
+
+        job = Broadcast(text="hello", selection=str(jim.pk))
+        job.save()
+        self.assertEqual(job.progress, None)
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(run_pending(), 0)
+
+        job = Broadcast.objects.get(pk=job.pk)
+        self.assertEqual((job.sent, job.total, job.progress), (1, 1, 100))
+        self.assertNotEqual(job.finished, None)
+        self.assertFalse(job.failed)
+
+        message = Outgoing.objects.get(in_response_to=job.request)
+        self.assertEqual(message.uri, "test://5")
+        self.assertEqual(message.priority, BULK)
+        self.assertEqual(message.in_response_to, job.request)
+
+    def test_search(self):
+        from djangosms.core.models import Outgoing
+        from djangosms.reporter.broadcast import run
+        from djangosms.reporter.models import Broadcast
+        self._reporters()
+
+        job = Broadcast(text="hello")
+        job.save()
+        run(job)
+        self.assertEqual(Outgoing.objects.filter(
+            in_response_to=job.request).count(), 2)
+
+        job = Broadcast(text="hello", search="Bob")
+        job.save()
+        run(job)
+        self.assertEqual(Outgoing.objects.filter(
+            in_response_to=job.request).count(), 1)
+
+    def test_resume(self):
+        from datetime import datetime
+        from datetime import timedelta
+        from djangosms.core.models import Outgoing
+        from djangosms.core.models import Request
+        from djangosms.reporter.broadcast import run_pending
+        from djangosms.reporter.models import Broadcast
+        bob, jim = self._reporters()
+
+        # a job abandoned after sending the message to bob
+        request = Request.objects.create(text="hello")
+        request.respond(bob.most_recent_connection, "hello")
+        updated = datetime.now() - timedelta(hours=1)
+        job = Broadcast(text="hello", request=request, sent=1,
+                        started=updated, updated=updated)
+        job.save()
+
+        self.assertEqual(run_pending(), 1)
+        job = Broadcast.objects.get(pk=job.pk)
+        self.assertEqual((job.sent, job.total, job.progress), (2, 2, 100))
+        self.assertEqual(sorted(Outgoing.objects.filter(
+            in_response_to=request).values_list('uri', flat=True)),
+            ["test://4", "test://5"])
+
+        # a job which is in progress is left alone
+        job = Broadcast(text="hello", started=datetime.now(),
+                        updated=datetime.now())
+        job.save()
+        self.assertEqual(run_pending(), 0)
+
+    def test_claim_lost(self):
+        from datetime import datetime
+        from djangosms.reporter.broadcast import ClaimLost
+        from djangosms.reporter.broadcast import run
+        from djangosms.reporter.models import Broadcast
+        self._reporters()
+
+        job = Broadcast(text="hello", updated=datetime(2000, 1, 1))
+        job.save()
+
+        # the job has since been claimed by another worker
+        Broadcast.objects.filter(pk=job.pk).update(updated=datetime.now())
+        self.assertRaises(ClaimLost, run, job)
@@ -7,11 +7,13 @@ from .views import dashboard
 from .views import static
 
 from djangosms.core.views import loadmsg
+from djangosms.core.views import loadmsgs
 
 urlpatterns = patterns(
     '',
     url(r'^$', dashboard),
     url(r'^static$', static),
     url(r'^loadmsg$', loadmsg),
+    url(r'^loadmsgs$', loadmsgs),
 )
 
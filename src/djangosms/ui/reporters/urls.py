@@ -6,5 +6,6 @@ from . import views
 urlpatterns = patterns(
     '',
     url(r'^reporters/?$', views.index),
+    url(r'^reporters/broadcasts/?$', views.broadcasts),
     url(r'^whitelist/?$', views.whitelist)
 )
@@ -1,16 +1,17 @@
-from django.db.models.aggregates import Max
 from django.core.paginator import Paginator
 from django.shortcuts import render_to_response
 from django.contrib.auth.decorators import login_required
 from django.template import RequestContext
 from django.http import HttpResponseRedirect
 from django.http import HttpResponse as Response
+from django.utils import simplejson
 from django import forms
 
 from djangosms.core.models import Message
 from djangosms.core.models import Outgoing
-from djangosms.core.models import Request
 
+from djangosms.reporter import broadcast
+from djangosms.reporter.models import Broadcast
 from djangosms.reporter.models import Reporter
 from djangosms.reporter.models import query_reporters
 
@@ -44,7 +45,7 @@ def index(req):
         ("name", "Name", "name", None),
         ("group", "Location", "group__name", None),
         ("role", "Role", "roles__name", None),
-        ("activity", "Last activity", "activity", Max("connections__messages__time")),
+        ("activity", "Last activity", "last_seen", None),
         (None, "Message", None, None),
         )
 
@@ -63,24 +64,23 @@ def index(req):
     form = SendForm(req.POST)
     if req.method == 'POST' and form.is_valid():
         text = form.cleaned_data.get('text') or None
-        reporters = req.POST.getlist('reporter')
+        reporters = [pk for pk in req.POST.getlist('reporter') if pk.isdigit()]
 
         if text is None:
             req.notifications.add(u"No text was submitted; ignored.")
+        elif not req.POST.get('all') and not reporters:
+            req.notifications.add(u"No reporters were selected; ignored.")
         else:
-            if not req.POST.get('all'):
-                query = Reporter.objects.filter(pk__in=reporters)
+            # the job is run by the broadcast worker
+            job = Broadcast(text=text)
+            if req.POST.get('all'):
+                job.search = search_string
+            else:
+                job.selection = ",".join(reporters)
+            job.save()
+            broadcast.notify()
 
-            request = Request(text=text)
-            request.save()
-
-            for reporter in query.all():
-                uri = reporter.most_recent_connection.uri
-                message = Outgoing(text=text, uri=uri, in_response_to=request)
-                message.save()
-
-            req.notifications.add(
-                u"Message sent to %d recipient(s)." % query.count())
+            req.notifications.add(u"Message queued for sending.")
 
         # redirect to GET action
         return HttpResponseRedirect(req.path)
@@ -127,9 +127,25 @@ def index(req):
         "sort_descending": sort_descending,
         "search_string": search_string,
         "req": req,
-        "count" : count
+        "count" : count,
+        "broadcasts": Broadcast.objects.all()[:5],
         }, RequestContext(req))
 
+@login_required
+def broadcasts(req):
+    """Return progress of recent broadcast jobs (JSON)."""
+
+    results = [{
+        'id': job.pk,
+        'sent': job.sent,
+        'total': job.total,
+        'progress': job.progress,
+        'finished': job.finished is not None,
+        'failed': job.failed,
+        } for job in Broadcast.objects.all()[:5]]
+
+    return Response(simplejson.dumps(results), mimetype="application/json")
+
 
 def _get_sort_info(request, default_sort_column, default_sort_descending):
     sort_column = default_sort_column
@@ -1,6 +1,5 @@
 from itertools import chain
 
-from django.db.models.aggregates import Max
 from django.dispatch import Signal
 from django.core.paginator import Paginator
 from django.shortcuts import render_to_response
@@ -10,6 +9,7 @@ from django.template.defaultfilters import title
 from django.http import HttpResponseRedirect
 from django import forms
 
+from djangosms.core.models import BULK
 from djangosms.core.models import Incoming
 from djangosms.core.models import Outgoing
 from djangosms.core.models import Request
@@ -37,7 +37,7 @@ def index(req):
         ("name", "Name", "name", None),
         ("group", "Location", "group__name", None),
         ("role", "Role", "roles__name", None),
-        ("activity", "Last activity", "activity", Max("connections__messages__time")),
+        ("activity", "Last activity", "last_seen", None),
         (None, "Messages", None, None),
         (None, "Erroneous", None, None),
         )
@@ -81,7 +81,9 @@ def index(req):
 
             if request is not None:
                 uri = reporter.most_recent_connection.uri
-                message = Outgoing(text=text, uri=uri, in_response_to=request)
+                message = Outgoing(
+                    text=text, uri=uri, in_response_to=request,
+                    priority=BULK)
                 message.save()
 
             graduated.append(reporter)